@@ -1,35 +1,129 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import firestore
+import os
 import time
+import html
 import hashlib
 import base64
 import re
 import uuid
+from functools import lru_cache
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
+from types import SimpleNamespace
 from datetime import datetime, timedelta, timezone
 import streamlit.components.v1 as components
+from bulk_ops import BulkJobRunner, batched_update, bulk_delete
+from word_filter import compile_banned_words
+from ttl_cache import TTLCache
+from scheduler import PeriodicScheduler
+from send_queue import SendQueue
+from archive import MessageArchive
+from datastore import DEFAULT_ROOM, DOCUMENT_ID, open_store
+import perf
 
 # --- 1. 페이지 설정 ---
 st.set_page_config(page_title="실시간 채팅", page_icon="💬", layout="wide")
 
+# 메시지 목록 전체를 요소 하나로 그리는 가벼운 컴포넌트 (삭제 버튼 클릭만 돌려준다)
+chat_list_component = components.declare_component(
+    "chat_list", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "chat_list")
+)
+
 # --- 2. 설정값 ---
+# 방마다 기본으로 보관하는 메시지 수이자 화면에 보여 주는 최근 메시지 수. 방별 보관 개수는 system/config의 rooms에서 바꾼다
 MAX_CHAT_MESSAGES = 50
+MAX_ROOM_MESSAGES = 5000
+DEFAULT_ROOM_NAME = "전체 채팅"
 KST = timezone(timedelta(hours=9))
+# 수정 시각(updated_at) 비교 시 서버/클라이언트 시계 차이를 흡수하기 위한 여유 시간
+CHAT_SYNC_SKEW = timedelta(seconds=10)
+# 공유 리스너 버퍼를 다시 그리는 주기(초)와 리스너 첫 응답을 기다리는 최대 시간(초)
+CHAT_REFRESH_INTERVAL = 1
+CHAT_FEED_READY_TIMEOUT = 2
+# 한 번의 WriteBatch로 지울 수 있는 최대 문서 수 (Firestore 제한 500)
+CHAT_TRIM_BATCH_SIZE = 500
+# 작성자 프로필 캐시 크기와 유지 시간(초). users 리스너가 변경을 감지하면 즉시 무효화된다
+PROFILE_CACHE_SIZE = 2000
+PROFILE_CACHE_TTL = 300
+# 추방/계정 만료와 설정 변경이 반영되기까지의 최대 지연(초). 리스너가 살아 있으면 거의 즉시 반영된다
+KICK_CHECK_TTL = 10
+CONFIG_CACHE_TTL = 10
+# 아바타/시간 문자열/메시지 HTML 메모이제이션 크기
+AVATAR_CACHE_SIZE = 1024
+TIME_FORMAT_CACHE_SIZE = 4096
+MESSAGE_HTML_CACHE_SIZE = 2000
+MESSAGE_HTML_CACHE_TTL = 3600
+# 백그라운드 정리 작업 주기(초)와 익명 계정 보관 기간
+SCHEDULER_TRIM_INTERVAL = 60
+SCHEDULER_GUEST_EXPIRY_INTERVAL = 600
+SCHEDULER_ORPHAN_INTERVAL = 900
+GUEST_MAX_AGE = timedelta(days=1)
+# bcrypt 비용(라운드)과 동시에 돌릴 해싱 작업 수. 라운드를 바꾸면 다음 로그인 때 자동으로 다시 해싱된다
+BCRYPT_ROUNDS = 12
+PASSWORD_WORKERS = 4
+# 로그인 실패 제한: LOGIN_THROTTLE_WINDOW초 동안 아이디별/IP별 최대 실패 횟수 (학교는 IP를 같이 쓰므로 IP 기준은 넉넉하게)
+LOGIN_THROTTLE_WINDOW = 300
+# 실패 기록을 보관할 최대 키 수 (임의의 아이디를 뿌려도 메모리가 끝없이 늘지 않게)
+LOGIN_THROTTLE_MAX_KEYS = 100000
+# 앞단에 둔 믿을 수 있는 프록시 수. 0이면 연결 IP를 쓰고, 1 이상이면 X-Forwarded-For의 오른쪽에서 그 번째 값을 쓴다
+# (왼쪽 값은 클라이언트가 마음대로 넣을 수 있다)
+TRUSTED_PROXY_HOPS = int(os.environ.get("CHAT_TRUSTED_PROXY_HOPS", "0"))
+LOGIN_MAX_FAILURES_PER_ID = 5
+LOGIN_MAX_FAILURES_PER_IP = 50
+# 관리자 화면 목록의 한 페이지 크기
+MEMBER_PAGE_SIZE = 20
+MONITOR_PAGE_SIZE = 20
+INQUIRY_PAGE_SIZE = 10
+# "batch": 채팅 목록을 HTML 하나로 묶어서 전송, "elements": 메시지마다 Streamlit 요소 사용
+CHAT_RENDER_MODE = "batch"
+# 메시지 전송 묶음: SEND_WINDOW초 안에 들어온 전송을 최대 SEND_MAX_BATCH개까지 한 번에 커밋, 일시 오류는 SEND_RETRIES번 재시도
+SEND_WINDOW = 0.05
+SEND_MAX_BATCH = 200
+SEND_RETRIES = 3
+# 전송이 끝났는데도 리스너 버퍼에 보이지 않는 내 메시지를 화면에서 치우기까지의 시간(초)
+SEND_ECHO_TIMEOUT = 30
+# 정리/삭제되는 메시지를 쌓아 두는 서버 디스크의 SQLite 보관함 (서버마다 자기가 지운 메시지를 보관한다)
+ARCHIVE_PATH = os.environ.get("CHAT_ARCHIVE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_archive.db"))
+ARCHIVE_PAGE_SIZE = 20
 
 # --- 3. 유틸리티 함수들 ---
 
 # bcrypt를 이용한 비밀번호 해싱 (회원가입용)
+# bcrypt는 GIL을 놓기 때문에 작업 스레드 풀에서 돌리면 다른 세션의 화면 갱신이 막히지 않는다
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return get_password_pool().submit(_hash_password, password).result()
+
+def _hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 # 비밀번호 검증 함수 (로그인용)
 def check_password(input_password, stored_hash):
+    return get_password_pool().submit(_check_password, input_password, stored_hash).result()
+
+def _check_password(input_password, stored_hash):
     try:
         return bcrypt.checkpw(input_password.encode('utf-8'), stored_hash.encode('utf-8'))
     except ValueError:
         return False
 
+def needs_rehash(stored_hash):
+    # "$2b$12$..." 형식에서 라운드를 읽어 현재 설정과 다른지 확인
+    try:
+        return int(stored_hash.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+def get_client_ip():
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [part.strip() for part in st.context.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return getattr(st.context, "ip_address", None)
+
+@lru_cache(maxsize=AVATAR_CACHE_SIZE)
 def get_custom_avatar(user_id, specific_color=None):
     if user_id == "ADMIN_ACCOUNT":
         return "📢"
@@ -52,50 +146,1066 @@ def get_custom_avatar(user_id, specific_color=None):
     b64_svg = base64.b64encode(svg_code.encode("utf-8")).decode("utf-8")
     return f"data:image/svg+xml;base64,{b64_svg}"
 
-def maintain_chat_history():
-    docs = chat_ref.order_by("timestamp").stream()
-    doc_list = list(docs)
-    if len(doc_list) > MAX_CHAT_MESSAGES:
-        delete_count = len(doc_list) - MAX_CHAT_MESSAGES
-        for i in range(delete_count):
-            doc_list[i].reference.delete()
+def stats_increment(**deltas):
+    return {field: firestore.Increment(delta) for field, delta in deltas.items()}
+
+def hourly_stats_ref(now=None):
+    hour = (now or datetime.now(KST)).strftime("%Y%m%d%H")
+    return stats_hourly_ref.document(hour)
+
+def add_chat_message(data, batch=None, room_id=DEFAULT_ROOM):
+    # 메시지 추가와 방 크기/시간대별 카운터 증가를 한 번의 커밋으로 처리.
+    # batch를 넘기면 거기에 쓰기만 담고 커밋은 호출한 쪽에서 한다
+    commit = batch is None
+    if commit:
+        batch = db.batch()
+    add_chat_messages(batch, [(room_id, None, data)])
+    if commit:
+        batch.commit()
+
+def add_chat_messages(batch, messages):
+    # messages: [(방 ID, 문서 ID 또는 None, 데이터)]. 여러 메시지를 담아도 카운터 문서는 한 번씩만 쓴다
+    room_counts = {}
+    for room_id, doc_id, data in messages:
+        batch.set(room_chat_ref(room_id).document(doc_id), data)
+        room_counts[room_id] = room_counts.get(room_id, 0) + 1
+    for room_id, count in room_counts.items():
+        batch.set(room_counter_ref(room_id), stats_increment(message_count=count), merge=True)
+    batch.set(stats_ref, stats_increment(message_count=len(messages)), merge=True)
+    user_messages = sum(1 for _, _, data in messages if data.get("user_id") != "SYSTEM_ENTRY")
+    if user_messages:
+        now = datetime.now(KST)
+        batch.set(hourly_stats_ref(now), {"hour": now.strftime("%Y%m%d%H"), "messages": firestore.Increment(user_messages)}, merge=True)
+
+def recount_stats():
+    # 카운터가 없거나 어긋났을 때 count() 집계 쿼리로 다시 맞춘다 (방별 카운터 포함)
+    total_users = users_ref.count().get()[0][0].value
+    guests = users_ref.where("is_guest", "==", True).count().get()[0][0].value
+    batch = db.batch()
+    total_messages = 0
+    for room_id in get_rooms(get_system_config()):
+        room_messages = room_chat_ref(room_id).count().get()[0][0].value
+        batch.set(room_counter_ref(room_id), {"message_count": room_messages}, merge=True)
+        total_messages += room_messages
+    counts = {
+        "user_count": total_users - guests,
+        "guest_count": guests,
+        "message_count": total_messages
+    }
+    batch.set(stats_ref, counts, merge=True)
+    batch.commit()
+    return counts
+
+def load_stats():
+    snap = stats_ref.get()
+    stats = snap.to_dict() if snap.exists else {}
+    if "user_count" not in stats or "guest_count" not in stats:
+        stats.update(recount_stats())
+    return stats
+
+def active_user_ids(messages, minutes=10):
+    # 방마다 공유 버퍼의 최근 MAX_CHAT_MESSAGES개(입장 알림 포함)로 계산하므로 추가 조회가 없다.
+    # 버퍼가 꽉 찼는데 가장 오래된 메시지도 기준 시각 안이면 그보다 앞선 활동은 보이지 않으므로 partial=True
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    active = set()
+    oldest = None
+    for data in messages.values():
+        ts = data.get("timestamp")
+        if ts and (oldest is None or ts < oldest):
+            oldest = ts
+        if not ts or ts < cutoff:
+            continue
+        user_id = data.get("related_user_id") or data.get("user_id")
+        if user_id not in FIXED_PROFILES:
+            active.add(user_id)
+    partial = len(messages) >= MAX_CHAT_MESSAGES and oldest is not None and oldest >= cutoff
+    return active, partial
+
+def maintain_chat_history(room_id=DEFAULT_ROOM):
+    # 실제 정리는 백그라운드 스레드에서 하므로 전송하는 쪽은 기다리지 않는다
+    get_chat_retention(room_id).request_trim()
 
 def format_time_kst(timestamp):
     if not timestamp: return "-"
-    dt_kst = timestamp.astimezone(KST)
+    # 분 단위로만 표시하므로 같은 분의 메시지는 한 번만 포맷
+    return _format_minute_kst(int(timestamp.timestamp()) // 60)
+
+@lru_cache(maxsize=TIME_FORMAT_CACHE_SIZE)
+def _format_minute_kst(epoch_minute):
+    dt_kst = datetime.fromtimestamp(epoch_minute * 60, KST)
     return dt_kst.strftime("%Y-%m-%d %p %I:%M").replace("AM", "오전").replace("PM", "오후")
 
-def get_system_config():
+# --- 채팅 캐시: 세션마다 받은 메시지를 보관하고 바뀐 부분만 새로 받아온다 ---
+def reset_chat_cache():
+    st.session_state.chat_cache = {}
+    st.session_state.chat_room = None
+    st.session_state.chat_cursor = None
+    st.session_state.chat_edit_cursor = None
+    st.session_state.chat_epoch = None
+
+def _apply_chat_edit(cache, doc_id, data):
+    if doc_id in cache:
+        cache[doc_id] = data
+    edited_at = data.get("updated_at")
+    if edited_at and (st.session_state.chat_edit_cursor is None or edited_at > st.session_state.chat_edit_cursor):
+        st.session_state.chat_edit_cursor = edited_at
+
+def sync_chat_cache(room_id, chat_epoch):
+    # 관리자가 메시지를 완전히 지운 경우(전체 삭제, 알림 삭제) epoch가 바뀌므로 처음부터 다시 받는다. 방을 옮겨도 마찬가지
+    if st.session_state.chat_epoch != chat_epoch or st.session_state.chat_room != room_id:
+        reset_chat_cache()
+        st.session_state.chat_epoch = chat_epoch
+        st.session_state.chat_room = room_id
+    chat_ref = room_chat_ref(room_id)
+
+    cache = st.session_state.chat_cache
+    if st.session_state.chat_cursor is None:
+        st.session_state.chat_edit_cursor = datetime.now(timezone.utc) - CHAT_SYNC_SKEW
+        query = chat_ref.order_by("timestamp")
+    else:
+        query = chat_ref.order_by("timestamp").start_after({"timestamp": st.session_state.chat_cursor})
+
+        # 이미 받은 메시지의 수정/삭제 표시는 updated_at 기준으로 변경분만 반영
+        edits = chat_ref.where("updated_at", ">", st.session_state.chat_edit_cursor).stream()
+        for doc in edits:
+            data = doc.to_dict()
+            data["_update_time"] = doc.update_time
+            _apply_chat_edit(cache, doc.id, data)
+
+    for doc in query.stream():
+        data = doc.to_dict()
+        data["_update_time"] = doc.update_time
+        cache[doc.id] = data
+        if data.get("timestamp"):
+            st.session_state.chat_cursor = data["timestamp"]
+        _apply_chat_edit(cache, doc.id, data)
+
+    # 서버에서 정리된 오래된 메시지는 캐시에서도 제거
+    overflow = len(cache) - MAX_CHAT_MESSAGES
+    for doc_id in list(cache)[:max(overflow, 0)]:
+        del cache[doc_id]
+    return cache
+
+def get_chat_messages(room_id, sys_config):
+    # 서버 공용 리스너가 준비되어 있으면 Firestore를 읽지 않고 버퍼를 그대로 사용
+    feed = get_chat_feed(room_id)
+    if feed.ready.wait(CHAT_FEED_READY_TIMEOUT):
+        return feed.messages
+    return sync_chat_cache(room_id, sys_config.get("chat_epoch", 0))
+
+# --- 채팅방: 방 목록과 방별 설정(보관 개수, 얼리기, 금칙어)은 system/config의 rooms 맵에 둔다 ---
+def get_rooms(sys_config):
+    # 기본 방은 설정에 없어도 항상 있다
+    rooms = {DEFAULT_ROOM: {"name": DEFAULT_ROOM_NAME}}
+    rooms.update(sys_config.get("rooms") or {})
+    return rooms
+
+def room_settings(sys_config, room_id):
+    # 전체 설정(얼리기, 금칙어)은 모든 방에 함께 적용된다
+    room = get_rooms(sys_config).get(room_id) or {}
+    return {
+        "name": room.get("name") or room_id,
+        "max_messages": int(room.get("max_messages") or MAX_CHAT_MESSAGES),
+        "is_locked": bool(sys_config.get("is_locked", False) or room.get("is_locked", False)),
+        "banned_words": ",".join(w for w in (sys_config.get("banned_words", ""), room.get("banned_words", "")) if w),
+    }
+
+def room_id_error(room_id):
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,40}", room_id or ""):
+        return "방 ID는 영문, 숫자, -, _ 로 40자 이내여야 합니다."
+    return None
+
+def room_chat_ref(room_id):
+    return chat_ref if room_id == DEFAULT_ROOM else perf.traced(store.room_messages(room_id))
+
+def room_counter_ref(room_id):
+    return perf.traced(store.room_counter(room_id))
+
+# --- 작성자 프로필: 메시지에는 user_id만 두고 화면에 그릴 때 닉네임/색상을 합친다 ---
+FIXED_PROFILES = {
+    "ADMIN_ACCOUNT": {"nickname": "📢 관리자", "color": "#FF0000"},
+    "SYSTEM_ENTRY": {"nickname": "SYSTEM", "color": "#808080"},
+}
+
+def load_profiles(messages):
+    user_ids = set()
+    for data in messages:
+        user_ids.add(data.get("user_id"))
+        if data.get("related_user_id"):
+            user_ids.add(data["related_user_id"])
+    user_ids -= FIXED_PROFILES.keys()
+    user_ids.discard(None)
+    return get_profile_cache().get_many(user_ids)
+
+def resolve_profile(user_id, profiles, data=None):
+    if user_id in FIXED_PROFILES:
+        return FIXED_PROFILES[user_id]
+    profile = profiles.get(user_id)
+    if profile:
+        return {"nickname": profile.get("nickname", "-"), "color": profile.get("color", "#000000")}
+    # 로그아웃/추방으로 계정이 사라진 경우: 예전 메시지에 남은 값이나 아이디로 대신 표시
+    if data and data.get("name"):
+        return {"nickname": data["name"], "color": data.get("color", "#000000")}
+    if user_id and user_id.startswith("guest_"):
+        return {"nickname": f"익명_{user_id[6:]}", "color": None}
+    return {"nickname": "알수없음", "color": None}
+
+def describe_message(data, profiles):
+    # 화면에 보여줄 (이름, 색상, 본문)
+    msg_id = data.get("user_id")
+    if msg_id == "SYSTEM_ENTRY":
+        related_id = data.get("related_user_id")
+        if profiles.get(related_id) or not data.get("message"):
+            nick = resolve_profile(related_id, profiles)["nickname"]
+            return "SYSTEM", "#808080", f"👋 {nick}님이 입장했습니다."
+        return "SYSTEM", "#808080", data.get("message")
+    profile = resolve_profile(msg_id, profiles, data)
+    return profile["nickname"], profile["color"], data.get("message")
+
+def load_system_config():
     doc = system_ref.document("config").get()
     if doc.exists:
         return doc.to_dict()
     else:
-        default_config = {"is_locked": False, "banned_words": ""}
+        default_config = {"is_locked": False, "banned_words": "", "chat_epoch": 0}
         system_ref.document("config").set(default_config)
         return default_config
 
+def render_message_parts(doc_id, data, profiles):
+    # 메시지 하나를 그리는 데 필요한 HTML 조각. 문서가 바뀌지 않았고 작성자 프로필도 같으면 캐시를 그대로 쓴다
+    msg_name, msg_color, msg_text = describe_message(data, profiles)
+    key = (doc_id, data.get("_update_time"), msg_name, msg_color)
+    cache = get_message_html_cache()
+    parts = cache.get(key)
+    if parts is not None:
+        return parts
+
+    msg_id = data.get("user_id")
+    msg_time = format_time_kst(data.get("timestamp"))
+    is_deleted = data.get("is_deleted", False)
+    parts = {"name": msg_name, "color": msg_color, "text": msg_text, "time": msg_time, "is_deleted": is_deleted}
+    if msg_id == "SYSTEM_ENTRY":
+        parts["html"] = f"""
+                    <div style='text-align:center; color:#888; font-size:0.8em; margin: 10px 0;'>
+                        {msg_text} ({msg_time})
+                    </div>
+                    """
+        cache.put(key, parts)
+        return parts
+
+    if is_deleted:
+        if msg_id == "ADMIN_ACCOUNT":
+            display_text = "🚫 관리자에 의해 삭제된 공지입니다."
+        elif msg_text == "🚫 관리자에 의해 삭제된 글입니다.":
+            display_text = "🚫 관리자에 의해 삭제된 글입니다."
+        else:
+            display_text = f"🗑️ {msg_name}님이 삭제한 글입니다."
+        parts["display_text"] = display_text
+
+        parts["html"] = f"""<div style='color:#888;font-style:italic;'>{display_text}</div>
+                                <div style='display:block;text-align:right;font-size:0.7em;color:grey;'>{msg_time}</div>"""
+    else:
+        parts["html"] = f"""{msg_text}<div style='display:block;text-align:right;font-size:0.7em;color:grey;'>{msg_time}</div>"""
+
+    if msg_id == "ADMIN_ACCOUNT":
+        parts["notice"] = f"**[공지] {msg_text}**"
+    else:
+        parts["avatar"] = get_custom_avatar(msg_id, msg_color)
+        # 배치 렌더링에서는 아바타를 사용자별로 한 번만 보내고 메시지는 이 클래스로 가리킨다
+        parts["avatar_class"] = "av-" + hashlib.md5(parts["avatar"].encode()).hexdigest()[:12]
+        parts["name_html"] = f"<span style='color:{msg_color or '#000000'}; font-weight:bold;'>{msg_name}</span>"
+    cache.put(key, parts)
+    return parts
+
+def render_message_block(doc_id, data, parts, is_self):
+    # 배치 렌더링용 메시지 HTML. 사용자가 쓴 내용은 iframe 안에서 실행되지 않도록 이스케이프한다
+    block_key = "block_self" if is_self else "block"
+    if block_key in parts:
+        return parts[block_key]
+
+    msg_id = data.get("user_id")
+    time_html = f"<div class='time'>{parts['time']}</div>"
+    if msg_id == "SYSTEM_ENTRY":
+        block = f"<div class='sys'>{html.escape(parts['text'] or '')} ({parts['time']})</div>"
+    else:
+        if parts["is_deleted"]:
+            body = f"<div class='deleted'>{html.escape(parts['display_text'])}</div>{time_html}"
+        else:
+            body = f"{html.escape(parts['text'] or '')}{time_html}"
+
+        if msg_id == "ADMIN_ACCOUNT":
+            if parts["is_deleted"]:
+                block = f"<div class='row'><div class='avatar'>📢</div><div class='bubble'>{body}</div></div>"
+            else:
+                block = f"<div class='row'><div class='avatar'>📢</div><div class='notice'>[공지] {html.escape(parts['text'] or '')}</div></div>"
+        elif is_self:
+            delete_button = "" if parts["is_deleted"] else f"<button class='del' title='삭제' data-delete='{html.escape(doc_id)}'>🗑️</button>"
+            block = f"<div class='row self'><div class='bubble'>{body}</div>{delete_button}</div>"
+        else:
+            name_html = ""
+            if not parts["is_deleted"]:
+                name_html = f"<div class='name' style='color:{html.escape(parts['color'] or '#000000')}'>{html.escape(parts['name'])}</div>"
+            block = f"<div class='row'><div class='avatar {parts['avatar_class']}'></div><div class='bubble'>{name_html}{body}</div></div>"
+    parts[block_key] = block
+    return block
+
+def visible_pending_sends(room_id, chat_messages):
+    # 전송 큐에 넣은 내 메시지 중 아직 리스너 버퍼에 올라오지 않은 것만 남기고, 지금 방의 것만 돌려준다
+    now = time.time()
+    pending = [
+        p for p in st.session_state.pending_sends
+        if not (p.status == "sent" and ((p.room_id == room_id and p.doc_id in chat_messages) or now - p.created > SEND_ECHO_TIMEOUT))
+    ]
+    st.session_state.pending_sends = pending
+    return [p for p in pending if p.room_id == room_id]
+
+def render_pending_block(pending):
+    status = "⚠️ 전송 실패" if pending.status == "failed" else "전송 중…"
+    css_class = "failed" if pending.status == "failed" else "pending"
+    return (f"<div class='row self {css_class}'><div class='bubble'>{html.escape(pending.data.get('message', ''))}"
+            f"<div class='time'>{status}</div></div></div>")
+
+def show_failed_sends(pending_sends):
+    failed = [p for p in pending_sends if p.status == "failed"]
+    if not failed:
+        return
+    st.warning(f"⚠️ 보내지 못한 메시지가 {len(failed)}개 있습니다.")
+    fc1, fc2 = st.columns(2)
+    if fc1.button("다시 보내기", key="retry_failed_sends"):
+        for p in failed:
+            get_send_queue().retry(p)
+        st.rerun()
+    if fc2.button("지우기", key="drop_failed_sends"):
+        st.session_state.pending_sends = [p for p in st.session_state.pending_sends if p.status != "failed"]
+        st.rerun()
+
+# --- 관리자 목록 페이지네이션 (start_after 커서 + limit) ---
+def page_cursor(state_key, signature):
+    # 필터/검색 조건(signature)이 바뀌면 첫 페이지로 돌아간다
+    state = st.session_state.get(state_key)
+    if state is None or state["signature"] != signature:
+        state = {"signature": signature, "cursors": [None]}
+        st.session_state[state_key] = state
+    return state["cursors"][-1]
+
+def fetch_page(query, state_key, page_size, signature=None):
+    cursor = page_cursor(state_key, signature)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    docs = list(query.limit(page_size + 1).stream())
+    return docs[:page_size], len(docs) > page_size
+
+def fetch_archive_page(filters):
+    # 보관함(로컬 SQLite)도 같은 방식으로, 이전 페이지의 마지막 행을 커서로 삼는다
+    cursor = page_cursor("archive_page", filters)
+    return get_message_archive().search(**filters, limit=ARCHIVE_PAGE_SIZE, after=cursor)
+
+def page_controls(state_key, docs, has_next):
+    state = st.session_state[state_key]
+    page = len(state["cursors"])
+    pc1, pc2, pc3 = st.columns([1, 2, 1])
+    if pc1.button("◀ 이전", key=f"{state_key}_prev", disabled=page == 1):
+        state["cursors"].pop()
+        st.rerun()
+    pc2.caption(f"{page} 페이지")
+    if pc3.button("다음 ▶", key=f"{state_key}_next", disabled=not has_next):
+        state["cursors"].append(docs[-1])
+        st.rerun()
+
+def build_member_query(member_type, search_field, search_text):
+    query = users_ref
+    if member_type == "가입 회원":
+        query = query.where("is_guest", "==", False)
+    elif member_type == "익명":
+        query = query.where("is_guest", "==", True)
+
+    # 접두어 검색은 범위 조건으로 처리 (is_guest 필터와 같이 쓰면 복합 색인이 필요)
+    if search_text and search_field == "닉네임":
+        return query.where("nickname", ">=", search_text).where("nickname", "<", search_text + "\uf8ff").order_by("nickname")
+    id_path = DOCUMENT_ID
+    if search_text:
+        query = query.where(id_path, ">=", users_ref.document(search_text)).where(id_path, "<", users_ref.document(search_text + "\uf8ff"))
+    return query.order_by(id_path)
+
+def build_monitor_query(room_id, user_id, deleted_filter):
+    # user_id/is_deleted 조건과 timestamp 정렬을 같이 쓰면 복합 색인이 필요하다 (방 하위 컬렉션은 컬렉션 그룹 색인으로 한 번에 만들 수 있다)
+    query = room_chat_ref(room_id)
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+    if deleted_filter == "정상":
+        query = query.where("is_deleted", "==", False)
+    elif deleted_filter == "삭제됨":
+        query = query.where("is_deleted", "==", True)
+    return query.order_by("timestamp", direction=firestore.Query.DESCENDING)
+
+def build_inquiry_query(unread_only):
+    query = inquiry_ref
+    if unread_only:
+        query = query.where("is_read", "==", False)
+    return query.order_by("timestamp", direction=firestore.Query.DESCENDING)
+
+def backfill_guest_flags(progress):
+    # 예전에 가입한 회원 문서에 is_guest 필드가 없으면 회원 필터에 잡히지 않으므로 채워 넣는다
+    return batched_update(db, users_ref.stream(), lambda doc: (
+        None if "is_guest" in doc.to_dict() else {"is_guest": doc.id.startswith("guest_")}
+    ), progress)
+
+# --- 닉네임 예약: nicknames/{닉네임} 문서를 users 문서와 같은 트랜잭션으로 관리해서 중복을 막는다 ---
+def nickname_error(nickname):
+    # Firestore 문서 ID로 쓸 수 없는 닉네임 걸러내기
+    if not nickname:
+        return "닉네임을 입력해주세요."
+    if "/" in nickname or nickname in (".", "..") or (nickname.startswith("__") and nickname.endswith("__")):
+        return "사용할 수 없는 닉네임입니다."
+    return None
+
+def _nickname_taken(transaction, nickname, user_id):
+    # 예약 문서가 있어도 주인이 사라졌거나 닉네임을 바꿨다면(예전 예약) 가져다 쓸 수 있다
+    snap = nicknames_ref.document(nickname).get(transaction=transaction)
+    if not snap.exists:
+        return False
+    owner_id = snap.to_dict().get("user_id")
+    if owner_id == user_id:
+        return False
+    owner = users_ref.document(owner_id).get(transaction=transaction)
+    return owner.exists and owner.to_dict().get("nickname") == nickname
+
+def _register_user(transaction, user_id, nickname, password_hash):
+    if users_ref.document(user_id).get(transaction=transaction).exists:
+        return "이미 있는 아이디입니다."
+    if _nickname_taken(transaction, nickname, user_id):
+        return "이미 사용 중인 닉네임입니다. 다른 이름을 써주세요."
+    transaction.set(users_ref.document(user_id), {
+        "password": password_hash,
+        "nickname": nickname,
+        "last_login": firestore.SERVER_TIMESTAMP,
+        "is_guest": False
+    })
+    transaction.set(nicknames_ref.document(nickname), {"user_id": user_id})
+    transaction.set(stats_ref, stats_increment(user_count=1), merge=True)
+    return None
+
+def register_user(user_id, nickname, password_hash):
+    return run_transaction(_register_user, user_id, nickname, password_hash)
+
+def _change_nickname(transaction, user_id, new_nick):
+    user_snap = users_ref.document(user_id).get(transaction=transaction)
+    if not user_snap.exists:
+        return "존재하지 않는 회원입니다."
+    if _nickname_taken(transaction, new_nick, user_id):
+        return "이미 존재하는 닉네임입니다."
+    old_nick = user_snap.to_dict().get("nickname")
+    if old_nick and old_nick != new_nick:
+        old_ref = nicknames_ref.document(old_nick)
+        old_snap = old_ref.get(transaction=transaction)
+        if old_snap.exists and old_snap.to_dict().get("user_id") == user_id:
+            transaction.delete(old_ref)
+    transaction.update(users_ref.document(user_id), {"nickname": new_nick})
+    transaction.set(nicknames_ref.document(new_nick), {"user_id": user_id})
+    return None
+
+def change_nickname(user_id, new_nick):
+    # 이전 닉네임 반납과 새 닉네임 예약을 한 번에 처리. 실패하면 오류 문구를 돌려준다
+    return nickname_error(new_nick) or run_transaction(_change_nickname, user_id, new_nick)
+
+def _delete_user(transaction, user_id, nickname):
+    # 예약은 이 계정 것일 때만 반납 (예전 중복 닉네임 회원이나 "-" 기본값이 다른 계정의 예약을 풀지 않게)
+    reservation = None
+    if nickname and not nickname_error(nickname):
+        ref = nicknames_ref.document(nickname)
+        snap = ref.get(transaction=transaction)
+        if snap.exists and snap.to_dict().get("user_id") == user_id:
+            reservation = ref
+    transaction.delete(users_ref.document(user_id))
+    if reservation is not None:
+        transaction.delete(reservation)
+
+def delete_user(user_id, nickname):
+    # 계정 삭제 시 닉네임 예약도 함께 반납
+    run_transaction(_delete_user, user_id, nickname)
+
+def release_nicknames(user_docs):
+    # 일괄 삭제되는 계정(익명 유령 계정 등)의 닉네임 예약 반납. bulk_delete의 before_delete로 쓴다
+    owners = {}
+    for doc in user_docs:
+        nickname = doc.to_dict().get("nickname")
+        if nickname and not nickname_error(nickname):
+            owners[nickname] = doc.id
+    if not owners:
+        return
+    batch = db.batch()
+    released = 0
+    for snap in db.get_all([nicknames_ref.document(nickname) for nickname in owners]):
+        if snap.exists and snap.to_dict().get("user_id") == owners[snap.id]:
+            batch.delete(snap.reference)
+            released += 1
+    if released:
+        batch.commit()
+
+def backfill_nickname_reservations(progress):
+    # 예약 문서가 생기기 전에 가입한 회원들의 닉네임 예약 만들기 (먼저 가입한 순서로 차지)
+    reserved = {doc.id for doc in nicknames_ref.select([]).stream()}
+    batch = db.batch()
+    pending = done = 0
+    for doc in users_ref.order_by("last_login").stream():
+        nickname = doc.to_dict().get("nickname")
+        if not nickname or nickname in reserved or nickname_error(nickname):
+            continue
+        reserved.add(nickname)
+        batch.set(nicknames_ref.document(nickname), {"user_id": doc.id})
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            done += pending
+            pending = 0
+            batch = db.batch()
+            progress(done)
+    if pending:
+        batch.commit()
+        done += pending
+    progress(done)
+
+@perf.timed("get_system_config")
+def get_system_config():
+    # 리스너가 받아 둔 설정을 우선 쓰고, 아직 없으면 짧은 TTL 캐시로 읽는다
+    feed = get_chat_feed()
+    if feed.config is not None:
+        return feed.config
+    return get_config_cache().get_or_load("config", load_system_config)
+
+def update_system_config(fields):
+    system_ref.document("config").update(fields)
+    # 리스너 갱신을 기다리지 않고 이 서버에는 바로 반영
+    feed = get_chat_feed()
+    if feed.config is not None:
+        feed.config = {**feed.config, **fields}
+    get_config_cache().invalidate()
+
+def user_exists(user_id):
+    # 추방 확인: 리스너가 삭제를 감지하면 즉시, 아니면 KICK_CHECK_TTL 안에 반영
+    profiles = get_profile_cache().get_many([user_id], max_age=KICK_CHECK_TTL)
+    return profiles.get(user_id) is not None
+
 def filter_message(text, banned_words_str):
     if not banned_words_str: return text
-    words = [w.strip() for w in banned_words_str.split(",") if w.strip()]
-    for word in words:
-        if word in text: text = text.replace(word, "*" * len(word))
-    return text
+    # 금칙어 문자열이 바뀔 때만 매처를 새로 만든다
+    return compile_banned_words(banned_words_str).filter(text)
+
+def rescan_recent_messages(room_id, count, banned_words_str):
+    # 금칙어를 추가한 뒤 최근 메시지 count개를 다시 걸러서 바뀐 것만 일괄 수정
+    def refilter(doc):
+        data = doc.to_dict()
+        if data.get("user_id") == "SYSTEM_ENTRY" or data.get("is_deleted", False):
+            return None
+        filtered = filter_message(data.get("message", ""), banned_words_str)
+        if filtered == data.get("message", ""):
+            return None
+        return {"message": filtered, "updated_at": firestore.SERVER_TIMESTAMP}
+    query = room_chat_ref(room_id).order_by("timestamp", direction=firestore.Query.DESCENDING).limit(count)
+    return start_bulk_update(f"최근 메시지 {count}개 금칙어 재검사", [(query, refilter)])
+
+# --- 4. 데이터 저장소 연결 ---
+def get_data_backend():
+    # 환경변수 CHAT_DATA_BACKEND가 secrets의 data_backend보다 우선. "memory"면 Firebase 없이 프로세스 메모리에 저장
+    backend = os.environ.get("CHAT_DATA_BACKEND")
+    if backend:
+        return backend
+    try:
+        return st.secrets.get("data_backend", "firestore")
+    except FileNotFoundError:
+        return "firestore"
+
+@st.cache_resource
+def get_store(backend):
+    return open_store(backend, dict(st.secrets["firebase_key"]) if backend == "firestore" else None)
+
+# 앱에서 쓰는 참조는 호출마다 시간/읽기/쓰기 수를 재도록 감싸 둔다 (관리자 '성능' 탭). 저장소와 함께 프로세스당 한 번만 만든다
+@st.cache_resource
+def get_refs(backend):
+    store = get_store(backend)
+    return SimpleNamespace(**{
+        name: perf.traced(getattr(store, name))
+        for name in ("db", "users", "messages", "system", "inquiries", "stats", "stats_hourly", "nicknames")
+    })
+
+try:
+    data_backend = get_data_backend()
+    store = get_store(data_backend)
+    refs = get_refs(data_backend)
+except Exception as e:
+    st.error(f"🔥 Firebase 연결 실패: {e}")
+    st.stop()
+
+db = refs.db
+users_ref = refs.users
+chat_ref = refs.messages
+system_ref = refs.system
+inquiry_ref = refs.inquiries
+stats_ref = refs.stats
+stats_hourly_ref = refs.stats_hourly
+nicknames_ref = refs.nicknames
 
-# --- 4. Firebase 연결 ---
-if not firebase_admin._apps:
+def run_transaction(fn, *args):
+    # 트랜잭션 안의 읽기/쓰기도 세도록 transaction 객체를 감싸서 넘긴다
+    start = time.perf_counter()
     try:
-        cred_info = dict(st.secrets["firebase_key"])
-        cred = credentials.Certificate(cred_info)
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error(f"🔥 Firebase 연결 실패: {e}")
-        st.stop()
-
-db = firestore.client()
-users_ref = db.collection("users")
-chat_ref = db.collection("global_chat")
-system_ref = db.collection("system")
-inquiry_ref = db.collection("inquiries")
+        return store.run_transaction(lambda transaction, *a: fn(perf.traced(transaction, buffered=True), *a), *args)
+    finally:
+        perf.record_op("firestore.transaction", (time.perf_counter() - start) * 1000)
+
+# --- 4-1. 실시간 리스너 (서버 프로세스당 하나, 모든 세션이 공유) ---
+class ChatFeed:
+    # 방 하나의 최근 메시지 리스너. 기본 방 리스너는 system/config도 함께 듣는다
+    def __init__(self, chat_ref, config_ref=None):
+        self.messages = {}
+        self.config = None
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        query = chat_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(MAX_CHAT_MESSAGES)
+        self._chat_watch = query.on_snapshot(self._on_chat_snapshot)
+        self._config_watch = config_ref.on_snapshot(self._on_config_snapshot) if config_ref is not None else None
+
+    def _on_chat_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            # 읽는 쪽이 락 없이 쓸 수 있도록 매번 새 dict로 교체 (바뀐 문서만 다시 to_dict)
+            updated = dict(self.messages)
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    updated.pop(change.document.id, None)
+                else:
+                    data = change.document.to_dict()
+                    data["_update_time"] = change.document.update_time
+                    updated[change.document.id] = data
+            self.messages = {doc.id: updated[doc.id] for doc in reversed(docs) if doc.id in updated}
+        self.ready.set()
+
+    def _on_config_snapshot(self, docs, changes, read_time):
+        for doc in docs:
+            if doc.exists:
+                self.config = doc.to_dict()
+
+    def close(self):
+        self._chat_watch.unsubscribe()
+        if self._config_watch is not None:
+            self._config_watch.unsubscribe()
+
+class RoomWorkers:
+    # 방별 리스너와 정리 작업기. 방이 지워지면 close_stale()이 리스너를 끊고 목록에서 빼낸다
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feeds = {}
+        self._retentions = {}
+
+    def feed(self, room_id):
+        with self._lock:
+            feed = self._feeds.get(room_id)
+            if feed is None:
+                feed = self._feeds[room_id] = new_chat_feed(room_id)
+            return feed
+
+    def retention(self, room_id):
+        feed = self.feed(room_id)
+        with self._lock:
+            retention = self._retentions.get(room_id)
+            if retention is None:
+                retention = self._retentions[room_id] = new_chat_retention(room_id, feed)
+            return retention
+
+    def close_stale(self, room_ids):
+        # 설정에 없는 방(다른 서버에서 지운 방 포함)의 리스너를 끊고 대기 중인 정리도 멈춘다
+        with self._lock:
+            stale = [room_id for room_id in set(self._feeds) | set(self._retentions) if room_id not in room_ids]
+            closing = [(self._feeds.pop(room_id, None), self._retentions.pop(room_id, None)) for room_id in stale]
+        for feed, retention in closing:
+            if retention is not None:
+                retention.close()
+            if feed is not None:
+                feed.close()
+
+@st.cache_resource
+def get_room_workers():
+    return RoomWorkers()
+
+def new_chat_feed(room_id):
+    if room_id == DEFAULT_ROOM:
+        return ChatFeed(chat_ref, system_ref.document("config"))
+    return ChatFeed(room_chat_ref(room_id))
+
+def get_chat_feed(room_id=DEFAULT_ROOM):
+    return get_room_workers().feed(room_id)
+
+# --- 4-2. 채팅 보관 개수 관리 (카운터 기반, 백그라운드 정리) ---
+class ChatRetention:
+    # 방 하나의 보관 개수 관리. counter_ref는 방별 카운터, stats_ref는 전체 메시지 수, limit()은 현재 보관 개수(방이 없어졌으면 None),
+    # archive(docs)는 지울 문서를 삭제 전에 넘겨받는다
+    def __init__(self, run_transaction, chat_ref, counter_ref, stats_ref, feed, limit, archive=None):
+        self._run_transaction = run_transaction
+        self._chat_ref = chat_ref
+        self._counter_ref = counter_ref
+        self._stats_ref = stats_ref
+        self._feed = feed
+        self._limit = limit
+        self._archive = archive
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-retention")
+        self._lock = threading.Lock()
+        self._queued = False
+        self._closed = False
+
+    def close(self):
+        # 방이 지워졌을 때. 이미 대기 중인 정리는 실행되더라도 바로 끝나서 지운 카운터 문서를 다시 만들지 않는다
+        with self._lock:
+            self._closed = True
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def request_trim(self):
+        # 이미 대기 중인 정리 작업이 있으면 합쳐서 한 번만 실행
+        with self._lock:
+            if self._queued or self._closed:
+                return
+            self._queued = True
+            self._executor.submit(self._run)
+
+    def _run(self):
+        with self._lock:
+            self._queued = False
+        try:
+            self.trim()
+        except Exception:
+            logging.getLogger(__name__).exception("채팅 기록 정리 실패")
+
+    def trim_now(self):
+        # 스케줄러처럼 결과를 기다려야 하는 쪽도 같은 작업 스레드에서 실행해서 정리가 겹치지 않게 한다
+        with self._lock:
+            if self._closed:
+                return 0
+            future = self._executor.submit(self.trim)
+        return future.result()
+
+    def message_count(self):
+        snap = self._counter_ref.get()
+        count = (snap.to_dict() or {}).get("message_count") if snap.exists else None
+        if count is None:
+            # 카운터가 없으면 집계 쿼리로 한 번만 초기화
+            count = self._chat_ref.count().get()[0][0].value
+            self._counter_ref.set({"message_count": count}, merge=True)
+        return count
+
+    def trim(self):
+        limit = self._limit()
+        if self._closed or limit is None:
+            return 0
+        if self.message_count() <= limit:
+            return 0
+
+        # 리스너 버퍼의 최신 메시지 중 보관 개수 안에 드는 것은 카운터가 어긋나 있어도 지우지 않는다
+        keep = set(list(self._feed.messages)[-limit:]) if self._feed.ready.is_set() else set()
+        deleted, seen, chunk, overflow = self._run_transaction(self._trim_chunk, limit, keep)
+
+        if seen < chunk or deleted < seen:
+            # 카운터가 실제보다 크게 잡혀 있었던 경우 집계 쿼리로 다시 맞춘다
+            self._counter_ref.set({"message_count": self._chat_ref.count().get()[0][0].value}, merge=True)
+        elif overflow > chunk:
+            self.request_trim()
+        return deleted
+
+    def _trim_chunk(self, transaction, limit, keep):
+        # 카운터와 지울 문서를 한 트랜잭션에서 읽는다. 다른 서버가 같은 방을 먼저 정리했다면 커밋이 충돌해서
+        # 새 값으로 다시 계산하고, 이미 지워진 문서는 읽히지 않으므로 카운터는 실제로 지운 개수만큼만 줄어든다
+        snap = self._counter_ref.get(transaction=transaction)
+        overflow = ((snap.to_dict() or {}).get("message_count") or 0) - limit
+        if overflow <= 0:
+            return 0, 0, 0, overflow
+        chunk = min(overflow, CHAT_TRIM_BATCH_SIZE)
+        old_docs = self._chat_ref.order_by("timestamp").limit(chunk)
+        if self._archive is None:
+            old_docs = old_docs.select([])
+        seen = 0
+        doomed = []
+        for doc in old_docs.stream(transaction=transaction):
+            seen += 1
+            if doc.id not in keep:
+                doomed.append(doc)
+        # 트랜잭션이 다시 실행되면 보관도 다시 하지만, 보관함은 같은 메시지를 한 번만 남긴다
+        if self._archive and doomed:
+            self._archive(doomed)
+        for doc in doomed:
+            transaction.delete(doc.reference)
+        transaction.set(self._counter_ref, {"message_count": firestore.Increment(-len(doomed))}, merge=True)
+        transaction.set(self._stats_ref, {"message_count": firestore.Increment(-len(doomed))}, merge=True)
+        return len(doomed), seen, chunk, overflow
+
+def room_limit(room_id):
+    # 다른 서버에서 지운 방이면 None (정리하지 않고, 지워진 카운터 문서도 다시 만들지 않는다)
+    sys_config = get_system_config()
+    if room_id not in get_rooms(sys_config):
+        return None
+    return room_settings(sys_config, room_id)["max_messages"]
+
+def new_chat_retention(room_id, feed):
+    return ChatRetention(
+        run_transaction, room_chat_ref(room_id), room_counter_ref(room_id), stats_ref, feed,
+        lambda: room_limit(room_id),
+        archive=lambda docs: archive_messages(room_id, docs),
+    )
+
+def get_chat_retention(room_id=DEFAULT_ROOM):
+    return get_room_workers().retention(room_id)
+
+# --- 4-3. 일괄 작업기 (대량 수정을 백그라운드에서 500개씩 묶어 처리) ---
+@st.cache_resource
+def get_bulk_runner():
+    return BulkJobRunner(db)
+
+def track_bulk_job(job):
+    st.session_state.bulk_jobs[job.id] = -1
+    return job
+
+def start_bulk_update(label, steps):
+    return track_bulk_job(get_bulk_runner().submit_updates(label, steps))
+
+def start_bulk_task(label, fn):
+    return track_bulk_job(get_bulk_runner().submit_task(label, fn))
+
+def start_bulk_delete(label, query, on_done=None, before_delete=None):
+    return track_bulk_job(get_bulk_runner().submit_deletes(label, query, on_done, before_delete))
+
+@st.fragment(run_every=1)
+def show_bulk_job_progress():
+    runner = get_bulk_runner()
+    for job_id, reported in list(st.session_state.bulk_jobs.items()):
+        job = runner.get(job_id)
+        if job is None:
+            del st.session_state.bulk_jobs[job_id]
+        elif job.status == "done":
+            st.toast(f"✅ {job.label} 완료 ({job.done}개 처리)")
+            runner.forget(job_id)
+            del st.session_state.bulk_jobs[job_id]
+        elif job.status == "failed":
+            st.toast(f"⚠️ {job.label} 실패: {job.error}")
+            runner.forget(job_id)
+            del st.session_state.bulk_jobs[job_id]
+        elif job.done != reported:
+            st.toast(f"⏳ {job.label} 진행 중... {job.done}개 처리됨")
+            st.session_state.bulk_jobs[job_id] = job.done
+
+# --- 4-4. 작성자 프로필 캐시 (LRU + TTL, users 리스너로 무효화) ---
+class ProfileCache:
+    def __init__(self, db, users_ref, max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self._db = db
+        self._users_ref = users_ref
+        self._entries = TTLCache(ttl, max_size)
+        self._watch = users_ref.on_snapshot(self._on_users_snapshot)
+
+    def _on_users_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            self._entries.invalidate(change.document.id)
+
+    def invalidate(self, user_id):
+        self._entries.invalidate(user_id)
+
+    def get_many(self, user_ids, max_age=None):
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            entry = self._entries.get(user_id, max_age=max_age)
+            if entry is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = entry[0]
+        if not missing:
+            return result
+
+        # 캐시에 없는 사용자는 get_all 한 번으로 모아서 읽는다
+        refs = [self._users_ref.document(user_id) for user_id in missing]
+        fetched = {}
+        for snap in self._db.get_all(refs, field_paths=["nickname", "color"]):
+            fetched[snap.id] = snap.to_dict() if snap.exists else None
+        for user_id in missing:
+            # 없는 사용자(None)도 캐시해야 하므로 튜플로 감싸서 저장
+            profile = fetched.get(user_id)
+            self._entries.put(user_id, (profile,))
+            result[user_id] = profile
+        return result
+
+@st.cache_resource
+def get_profile_cache():
+    return ProfileCache(db, users_ref)
+
+@st.cache_resource
+def get_config_cache():
+    return TTLCache(CONFIG_CACHE_TTL)
+
+@st.cache_resource
+def get_message_html_cache():
+    return TTLCache(MESSAGE_HTML_CACHE_TTL, MESSAGE_HTML_CACHE_SIZE)
+
+def migrate_message_profiles(progress):
+    # 예전 메시지에 저장된 name/color를 users 문서로 옮기고, 계정이 남아 있는 사용자의 메시지에서는 지운다
+    docs = list(chat_ref.order_by("timestamp").stream())
+    latest_color = {}
+    for doc in docs:
+        data = doc.to_dict()
+        if data.get("color") and data.get("user_id") not in FIXED_PROFILES:
+            latest_color[data["user_id"]] = data["color"]
+
+    user_ids = {doc.to_dict().get("user_id") for doc in docs} - FIXED_PROFILES.keys()
+    user_ids.discard(None)
+    snaps = list(db.get_all([users_ref.document(user_id) for user_id in user_ids])) if user_ids else []
+    existing = {snap.id for snap in snaps if snap.exists}
+    batched_update(db, [snap for snap in snaps if snap.exists], lambda snap: (
+        {"color": latest_color[snap.id]}
+        if snap.id in latest_color and not snap.to_dict().get("color") else None
+    ))
+
+    def strip_fields(doc):
+        data = doc.to_dict()
+        if data.get("user_id") not in FIXED_PROFILES and data.get("user_id") not in existing:
+            return None
+        fields = {field: firestore.DELETE_FIELD for field in ("name", "color") if field in data}
+        if fields:
+            fields["updated_at"] = firestore.SERVER_TIMESTAMP
+        return fields
+    batched_update(db, docs, strip_fields, progress)
+
+# --- 4-5. 백그라운드 정리 스케줄러 (서버마다 하나, 작업별 Firestore 임대로 중복 실행 방지) ---
+def expire_stale_guests(on_progress=None):
+    cutoff = datetime.now(timezone.utc) - GUEST_MAX_AGE
+    deleted = bulk_delete(db, users_ref.where("is_guest", "==", True).where("last_login", "<", cutoff),
+                          on_progress, before_delete=release_nicknames)
+    if deleted:
+        stats_ref.set(stats_increment(guest_count=-deleted), merge=True)
+    return f"익명 계정 {deleted}개 삭제"
+
+def trim_chat_history():
+    rooms = get_rooms(get_system_config())
+    get_room_workers().close_stale(rooms)
+    deleted = sum(get_chat_retention(room_id).trim_now() for room_id in rooms)
+    return f"메시지 {deleted}개 정리"
+
+def compact_orphan_entries():
+    # 계정이 사라진 사용자의 입장 알림 정리
+    entries = list(chat_ref.where("user_id", "==", "SYSTEM_ENTRY").select(["related_user_id"]).stream())
+    related_ids = {doc.to_dict().get("related_user_id") for doc in entries} - {None}
+    existing = set()
+    if related_ids:
+        refs = [users_ref.document(user_id) for user_id in related_ids]
+        existing = {snap.id for snap in db.get_all(refs, field_paths=["nickname"]) if snap.exists}
+    orphans = [doc for doc in entries if doc.to_dict().get("related_user_id") not in existing]
+    for start in range(0, len(orphans), CHAT_TRIM_BATCH_SIZE):
+        batch = db.batch()
+        chunk = orphans[start:start + CHAT_TRIM_BATCH_SIZE]
+        for doc in chunk:
+            batch.delete(doc.reference)
+        batch.set(stats_ref, stats_increment(message_count=-len(chunk)), merge=True)
+        batch.set(room_counter_ref(DEFAULT_ROOM), stats_increment(message_count=-len(chunk)), merge=True)
+        batch.commit()
+    if orphans:
+        system_ref.document("config").update({"chat_epoch": firestore.Increment(1)})
+    return f"입장 알림 {len(orphans)}개 정리"
+
+@st.cache_resource
+def get_maintenance_scheduler():
+    scheduler = PeriodicScheduler(store.run_transaction, store.scheduler_locks)
+    scheduler.add_task("trim_chat_history", SCHEDULER_TRIM_INTERVAL, trim_chat_history)
+    scheduler.add_task("expire_stale_guests", SCHEDULER_GUEST_EXPIRY_INTERVAL, expire_stale_guests)
+    scheduler.add_task("compact_orphan_entries", SCHEDULER_ORPHAN_INTERVAL, compact_orphan_entries)
+    scheduler.start()
+    return scheduler
+
+get_maintenance_scheduler()
+
+# --- 4-6. 비밀번호 해싱 작업 풀과 로그인 시도 제한 ---
+@st.cache_resource
+def get_password_pool():
+    return ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+
+class LoginThrottle:
+    def __init__(self, window, max_keys=LOGIN_THROTTLE_MAX_KEYS):
+        self._window = window
+        self._max_keys = max_keys
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return []
+        failures[:] = [t for t in failures if now - t < self._window]
+        if not failures:
+            del self._failures[key]
+        return failures
+
+    def _sweep(self, now):
+        # 다시 조회되지 않는 키도 window마다 한 번씩 정리하고, 그래도 많으면 먼저 들어온 키부터 버린다
+        if now - self._last_sweep >= self._window:
+            self._last_sweep = now
+            for key in list(self._failures):
+                self._recent(key, now)
+        while len(self._failures) > self._max_keys:
+            del self._failures[next(iter(self._failures))]
+
+    def retry_after(self, limits):
+        # limits: {키: 최대 실패 횟수}. 막혀 있으면 다시 시도할 수 있을 때까지 남은 초를 돌려준다
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, limit in limits.items():
+                failures = self._recent(key, now)
+                if len(failures) >= limit:
+                    wait = max(wait, self._window - (now - failures[-limit]))
+        return int(wait) + 1 if wait else 0
+
+    def record_failure(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._recent(key, now)
+                self._failures.setdefault(key, []).append(now)
+            self._sweep(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+@st.cache_resource
+def get_login_throttle():
+    return LoginThrottle(LOGIN_THROTTLE_WINDOW)
+
+# --- 4-7. 메시지 전송 큐 (여러 세션의 전송을 짧게 모아 한 배치로 커밋, 정리는 커밋 후 백그라운드) ---
+def trim_rooms_after_send(items):
+    for room_id in {item.room_id for item in items}:
+        maintain_chat_history(room_id)
+
+@st.cache_resource
+def get_send_queue():
+    return SendQueue(
+        db,
+        lambda batch, items: add_chat_messages(batch, [(item.room_id, item.doc_id, item.data) for item in items]),
+        window=SEND_WINDOW,
+        max_batch=SEND_MAX_BATCH,
+        retries=SEND_RETRIES,
+        was_committed=lambda item: room_chat_ref(item.room_id).document(item.doc_id).get().exists,
+        on_commit=trim_rooms_after_send,
+    )
+
+# --- 4-8. 메시지 보관함 (지우기 전에 로컬 SQLite에 남겨서 Firestore 읽기 없이 검색) ---
+@st.cache_resource
+def get_message_archive():
+    return MessageArchive(ARCHIVE_PATH)
+
+def archive_messages(room_id, docs):
+    # 닉네임은 보관하는 시점의 것을 남긴다. 실패하면 예외가 그대로 올라가서 삭제도 하지 않는다
+    datas = [doc.to_dict() for doc in docs]
+    profiles = load_profiles(datas)
+    rows = []
+    for doc, data in zip(docs, datas):
+        name, _, text = describe_message(data, profiles)
+        rows.append({
+            "room_id": room_id, "doc_id": doc.id, "user_id": data.get("user_id"), "nickname": name,
+            "message": text, "timestamp": data.get("timestamp"), "is_deleted": data.get("is_deleted"),
+        })
+    get_message_archive().add_many(rows)
 
 # --- 5. 세션 초기화 ---
 if "logged_in" not in st.session_state: st.session_state.logged_in = False
@@ -103,6 +1213,12 @@ if "user_id" not in st.session_state: st.session_state.user_id = ""
 if "user_nickname" not in st.session_state: st.session_state.user_nickname = ""
 if "is_super_admin" not in st.session_state: st.session_state.is_super_admin = False
 if "user_color" not in st.session_state: st.session_state.user_color = "#000000"
+if "chat_cache" not in st.session_state: reset_chat_cache()
+if "bulk_jobs" not in st.session_state: st.session_state.bulk_jobs = {}
+if "pending_sends" not in st.session_state: st.session_state.pending_sends = []
+if "room_id" not in st.session_state: st.session_state.room_id = DEFAULT_ROOM
+
+perf.begin_rerun(st.session_state, "admin" if st.session_state.is_super_admin else "user" if st.session_state.logged_in else "login")
 
 
 # ==========================================
@@ -112,16 +1228,26 @@ if not st.session_state.logged_in:
     st.title("정동고 익명 채팅방 입장하기")
     tab1, tab2 = st.tabs(["로그인", "회원가입"])
     
-    with tab1:
+    with tab1, perf.section("login"):
         st.subheader("로그인")
         login_id = st.text_input("아이디", key="login_id")
         login_pw = st.text_input("비밀번호", type="password", key="login_pw")
         if st.button("로그인 하기"):
+            throttle = get_login_throttle()
+            client_ip = get_client_ip()
+            throttle_limits = {f"id:{login_id}": LOGIN_MAX_FAILURES_PER_ID}
+            if client_ip:
+                throttle_limits[f"ip:{client_ip}"] = LOGIN_MAX_FAILURES_PER_IP
+            retry_after = throttle.retry_after(throttle_limits)
+
             if not login_id or not login_pw:
                 st.warning("입력해주세요.")
+            elif retry_after:
+                st.error(f"로그인 시도가 너무 많습니다. {retry_after}초 후에 다시 시도해주세요.")
             else:
                 if login_id == "admin":
                     if "admin_password" in st.secrets and login_pw == st.secrets["admin_password"]:
+                        throttle.reset(f"id:{login_id}")
                         st.session_state.logged_in = True
                         st.session_state.user_id = "ADMIN_ACCOUNT"
                         st.session_state.user_nickname = "관리자"
@@ -129,31 +1255,41 @@ if not st.session_state.logged_in:
                         st.success("관리자 모드로 접속합니다.")
                         time.sleep(0.5)
                         st.rerun()
-                    else: st.error("관리자 비밀번호가 틀렸습니다.")
+                    else:
+                        throttle.record_failure(throttle_limits)
+                        st.error("관리자 비밀번호가 틀렸습니다.")
                 else:
                     doc = users_ref.document(login_id).get()
-                    if doc.exists and check_password(login_pw, doc.to_dict()['password']):
-                        users_ref.document(login_id).update({
-                            "last_login": firestore.SERVER_TIMESTAMP
-                        })
-                        st.session_state.logged_in = True
-                        st.session_state.user_id = login_id
-                        user_nick = doc.to_dict()['nickname']
-                        st.session_state.user_nickname = user_nick
-                        st.session_state.is_super_admin = False
-                        
-                        chat_ref.add({
+                    user_data = doc.to_dict() if doc.exists else None
+                    if user_data and check_password(login_pw, user_data['password']):
+                        throttle.reset(f"id:{login_id}")
+                        user_nick = user_data['nickname']
+                        login_update = {"last_login": firestore.SERVER_TIMESTAMP}
+                        if needs_rehash(user_data['password']):
+                            login_update["password"] = hash_password(login_pw)
+
+                        # 접속 시각 갱신과 입장 알림을 한 번의 커밋으로 처리 (정리는 백그라운드)
+                        batch = db.batch()
+                        batch.update(users_ref.document(login_id), login_update)
+                        add_chat_message({
                             "user_id": "SYSTEM_ENTRY",
                             "related_user_id": login_id,
-                            "name": "SYSTEM",
                             "message": f"👋 {user_nick}님이 입장했습니다.",
                             "timestamp": firestore.SERVER_TIMESTAMP,
-                            "is_deleted": False,
-                            "color": "#808080"
-                        })
+                            "is_deleted": False
+                        }, batch=batch)
+                        batch.commit()
                         maintain_chat_history()
+
+                        st.session_state.logged_in = True
+                        st.session_state.user_id = login_id
+                        st.session_state.user_nickname = user_nick
+                        st.session_state.user_color = user_data.get("color", "#000000")
+                        st.session_state.is_super_admin = False
                         st.rerun()
-                    else: st.error("아이디 또는 비밀번호가 틀립니다.")
+                    else:
+                        throttle.record_failure(throttle_limits)
+                        st.error("아이디 또는 비밀번호가 틀립니다.")
         
         st.caption("🔒 모든 비밀번호는 Bcrypt 암호화 기술로 안전하게 보호됩니다.")
 
@@ -163,34 +1299,38 @@ if not st.session_state.logged_in:
             guest_id = f"guest_{random_suffix}"
             guest_nick = f"익명_{random_suffix}"
             
-            users_ref.document(guest_id).set({
+            # 계정 생성, 닉네임 예약, 카운터, 입장 알림을 한 번의 커밋으로 처리 (정리는 백그라운드)
+            batch = db.batch()
+            batch.set(nicknames_ref.document(guest_nick), {"user_id": guest_id})
+            batch.set(users_ref.document(guest_id), {
                 "password": "GUEST_NO_PASSWORD",
                 "nickname": guest_nick,
+                "color": "#000000",
                 "last_login": firestore.SERVER_TIMESTAMP,
                 "is_guest": True 
             })
-            
-            st.session_state.logged_in = True
-            st.session_state.user_id = guest_id
-            st.session_state.user_nickname = guest_nick
-            st.session_state.is_super_admin = False
-            
-            chat_ref.add({
+            batch.set(stats_ref, stats_increment(guest_count=1), merge=True)
+            add_chat_message({
                 "user_id": "SYSTEM_ENTRY",
                 "related_user_id": guest_id,
-                "name": "SYSTEM",
                 "message": f"👋 {guest_nick}님이 입장했습니다.",
                 "timestamp": firestore.SERVER_TIMESTAMP,
-                "is_deleted": False,
-                "color": "#808080"
-            })
+                "is_deleted": False
+            }, batch=batch)
+            batch.commit()
             maintain_chat_history()
+            
+            st.session_state.logged_in = True
+            st.session_state.user_id = guest_id
+            st.session_state.user_nickname = guest_nick
+            st.session_state.user_color = "#000000"
+            st.session_state.is_super_admin = False
 
             st.success(f"'{guest_nick}'으로 입장합니다.")
             time.sleep(0.5)
             st.rerun()
 
-    with tab2:
+    with tab2, perf.section("signup"):
         st.subheader("회원가입")
         new_id = st.text_input("아이디", key="new_id")
         new_pw = st.text_input("비밀번호 (영문+숫자 4자 이상)", type="password", key="new_pw")
@@ -200,18 +1340,13 @@ if not st.session_state.logged_in:
             elif new_id.startswith("guest_"): st.error("guest_로 시작하는 아이디는 만들 수 없습니다.")
             elif len(new_pw) < 4 or not (re.search("[a-zA-Z]", new_pw) and re.search("[0-9]", new_pw)):
                 st.error("비밀번호 조건을 확인해주세요.")
-            elif users_ref.document(new_id).get().exists: st.error("이미 있는 아이디입니다.")
+            elif nickname_error(new_nick): st.error(nickname_error(new_nick))
             else:
-                # [수정된 부분] 들여쓰기 오류 해결
-                existing_nick = users_ref.where("nickname", "==", new_nick).limit(1).get()
-                if len(existing_nick) > 0:
-                    st.error("이미 사용 중인 닉네임입니다. 다른 이름을 써주세요.")
+                # 아이디/닉네임 중복 확인과 저장을 한 트랜잭션에서 처리
+                signup_error = register_user(new_id, new_nick, hash_password(new_pw))
+                if signup_error:
+                    st.error(signup_error)
                 else:
-                    users_ref.document(new_id).set({
-                        "password": hash_password(new_pw),
-                        "nickname": new_nick,
-                        "last_login": firestore.SERVER_TIMESTAMP
-                    })
                     st.success("가입 완료! 로그인해주세요.")
         
         st.caption("🔒 회원가입 시 비밀번호는 Bcrypt로 강력하게 암호화되어 저장됩니다.")
@@ -220,10 +1355,14 @@ if not st.session_state.logged_in:
 # [B] 로그인 성공 후
 # ==========================================
 else:
+    if st.session_state.bulk_jobs:
+        show_bulk_job_progress()
+
     # --- 접속 유효성 검사 (추방 확인 로직) ---
     if not st.session_state.is_super_admin:
-        check_user = users_ref.document(st.session_state.user_id).get()
-        if not check_user.exists:
+        with perf.section("kick_check"):
+            kicked = not user_exists(st.session_state.user_id)
+        if kicked:
             st.error("🚫 관리자에 의해 추방되었거나 계정이 만료되었습니다.")
             st.session_state.logged_in = False
             time.sleep(2)
@@ -231,6 +1370,7 @@ else:
     # --------------------------------------------------
 
     sys_config = get_system_config()
+    get_room_workers().close_stale(get_rooms(sys_config))
     is_chat_locked = sys_config.get("is_locked", False)
     banned_words = sys_config.get("banned_words", "")
 
@@ -257,35 +1397,63 @@ else:
 
         st.title("🛡️ 관리자 통제 센터")
         
-        admin_tab1, admin_tab2, admin_tab3, admin_tab4, admin_tab5 = st.tabs(["📊 통계", "👥 회원 관리", "📢 모니터링", "⚙️ 시스템 설정", "📩 문의함"])
+        admin_tab1, admin_tab2, admin_tab3, admin_tab4, admin_tab5, admin_tab6, admin_tab7 = st.tabs(["📊 통계", "👥 회원 관리", "📢 모니터링", "⚙️ 시스템 설정", "📩 문의함", "⏱️ 성능", "🗄️ 보관함"])
         
-        with admin_tab1:
-            all_users = list(users_ref.stream())
-            all_chats = list(chat_ref.stream())
-            c1, c2 = st.columns(2)
-            c1.metric("총 회원", f"{len(all_users)}명")
-            c2.metric("총 메시지", f"{len(all_chats)}개")
-
-        with admin_tab2:
+        with admin_tab1, perf.section("admin.stats"):
+            stats = load_stats()
+            hourly = [doc.to_dict() for doc in stats_hourly_ref.order_by("hour", direction=firestore.Query.DESCENDING).limit(24).stream()]
+            this_hour = hourly[0].get("messages", 0) if hourly and hourly[0].get("hour") == datetime.now(KST).strftime("%Y%m%d%H") else 0
+
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("총 회원", f"{stats.get('user_count', 0) + stats.get('guest_count', 0)}명",
+                      help=f"가입 회원 {stats.get('user_count', 0)}명 / 익명 {stats.get('guest_count', 0)}명")
+            c2.metric("총 메시지", f"{stats.get('message_count', 0)}개")
+            c3.metric("이번 시간 메시지", f"{this_hour}개")
+            active_users, active_partial = set(), False
+            for stats_room in get_rooms(sys_config):
+                room_active, room_partial = active_user_ids(get_chat_messages(stats_room, sys_config))
+                active_users |= room_active
+                active_partial = active_partial or room_partial
+            c4.metric("최근 메시지 기준 활동 사용자", f"{len(active_users)}명" + ("+" if active_partial else ""),
+                      help=f"방마다 최근 {MAX_CHAT_MESSAGES}개 메시지 중 10분 안의 것으로 셉니다. "
+                           "'+'는 메시지가 많아 10분 전체가 버퍼에 들어 있지 않은 방이 있다는 뜻으로, 실제 인원은 더 많을 수 있습니다.")
+
+            if hourly:
+                st.caption("시간대별 메시지 수 (최근 24시간)")
+                st.bar_chart([
+                    {"시간": f"{h['hour'][4:6]}/{h['hour'][6:8]} {h['hour'][8:]}시", "메시지": h.get("messages", 0)}
+                    for h in reversed(hourly)
+                ], x="시간", y="메시지")
+            if st.button("🔄 카운터 다시 계산"):
+                recount_stats()
+                st.rerun()
+
+        with admin_tab2, perf.section("admin.members"):
             st.subheader("회원 목록 및 관리")
             st.info("💡 로그아웃을 안 하고 창을 닫은 익명 유저들이 목록에 남을 수 있습니다.")
             if st.button("🧹 24시간 지난 익명 유령 계정 삭제"):
-                deleted_count = 0
-                cutoff = datetime.now(timezone.utc) - timedelta(days=1)
-                guests = users_ref.where("is_guest", "==", True).stream()
-                for g in guests:
-                    g_data = g.to_dict()
-                    last_login = g_data.get("last_login")
-                    if last_login and last_login < cutoff:
-                        g.reference.delete()
-                        deleted_count += 1
-                st.success(f"{deleted_count}개의 유령 계정을 삭제했습니다.")
-                time.sleep(1)
-                st.rerun()
+                # 주기 정리 작업을 같은 임대를 잡고 바로 실행한다 (다른 서버/스케줄러와 겹쳐 guest_count를 두 번 빼지 않게)
+                start_bulk_task("유령 계정 삭제", lambda progress: get_maintenance_scheduler().run_now(
+                    "expire_stale_guests", on_progress=progress))
+                st.toast("유령 계정 삭제를 시작했습니다.")
 
             st.divider()
-            
-            if all_users:
+
+            fc1, fc2, fc3 = st.columns([1.5, 1, 2])
+            member_type = fc1.radio("구분", ["전체", "가입 회원", "익명"], horizontal=True)
+            search_field = fc2.selectbox("검색 기준", ["아이디", "닉네임"])
+            search_text = fc3.text_input("검색어 (앞부분 일치)").strip()
+            if "/" in search_text:
+                st.warning("검색어에 '/'는 사용할 수 없습니다.")
+                search_text = ""
+            page_users, has_next_users = fetch_page(
+                build_member_query(member_type, search_field, search_text), "member_page", MEMBER_PAGE_SIZE,
+                signature=(member_type, search_field, search_text)
+            )
+
+            if not page_users:
+                st.info("조건에 맞는 회원이 없습니다.")
+            else:
                 c1, c2, c3, c4 = st.columns([1.5, 1.5, 2, 1.5])
                 c1.markdown("**ID**")
                 c2.markdown("**현재 닉네임**")
@@ -293,7 +1461,7 @@ else:
                 c4.markdown("**관리**")
                 st.divider()
                 
-                for user in all_users:
+                for user in page_users:
                     u_data = user.to_dict()
                     u_id = user.id
                     u_nick = u_data.get("nickname", "-")
@@ -306,47 +1474,82 @@ else:
                         new_admin_nick = st.text_input("new_nick", value=u_nick, key=f"adn_{u_id}", label_visibility="collapsed")
                         if new_admin_nick != u_nick:
                             if st.button("변경 적용", key=f"btn_adn_{u_id}"):
-                                users_ref.document(u_id).update({"nickname": new_admin_nick})
-                                u_msgs = chat_ref.where("user_id", "==", u_id).stream()
-                                for m in u_msgs: m.reference.update({"name": new_admin_nick})
-                                sys_msgs = chat_ref.where("related_user_id", "==", u_id).stream()
-                                for s in sys_msgs:
-                                    s.reference.update({"message": f"👋 {new_admin_nick}님이 입장했습니다."})
-                                st.toast(f"{u_nick} -> {new_admin_nick} 변경 완료")
-                                time.sleep(1)
-                                st.rerun()
+                                rename_error = change_nickname(u_id, new_admin_nick.strip())
+                                if rename_error:
+                                    st.error(rename_error)
+                                else:
+                                    get_profile_cache().invalidate(u_id)
+                                    st.toast(f"{u_nick} -> {new_admin_nick} 변경 완료")
+                                    time.sleep(1)
+                                    st.rerun()
 
                     if cc4.button("추방", key=f"ban_{u_id}", type="primary"):
-                        users_ref.document(u_id).delete()
+                        delete_user(u_id, u_nick)
+                        if u_id.startswith("guest_"):
+                            stats_ref.set(stats_increment(guest_count=-1), merge=True)
+                        else:
+                            stats_ref.set(stats_increment(user_count=-1), merge=True)
+                        get_profile_cache().invalidate(u_id)
                         st.toast(f"{u_nick}님을 추방했습니다.")
                         time.sleep(1)
                         st.rerun()
 
-        with admin_tab3:
+                page_controls("member_page", page_users, has_next_users)
+
+        with admin_tab3, perf.section("admin.monitor"):
             st.subheader("실시간 모니터링")
-            if st.button("🗑️ 채팅방 기록 전체 삭제 (초기화)", type="primary"):
-                docs = chat_ref.stream()
-                for doc in docs: doc.reference.delete()
-                st.success("삭제 완료")
-                time.sleep(1)
-                st.rerun()
+            monitor_rooms = get_rooms(sys_config)
+            monitor_room = st.selectbox("채팅방", list(monitor_rooms), format_func=lambda r: monitor_rooms[r].get("name") or r)
+            monitor_ref = room_chat_ref(monitor_room)
+            monitor_banned_words = room_settings(sys_config, monitor_room)["banned_words"]
+            if st.button("🗑️ 이 채팅방 기록 전체 삭제 (초기화)", type="primary"):
+                def finish_chat_wipe(deleted, wiped_room=monitor_room):
+                    batch = db.batch()
+                    batch.set(stats_ref, stats_increment(message_count=-deleted), merge=True)
+                    batch.set(room_counter_ref(wiped_room), stats_increment(message_count=-deleted), merge=True)
+                    batch.update(system_ref.document("config"), {"chat_epoch": firestore.Increment(1)})
+                    batch.commit()
+                start_bulk_delete("채팅방 기록 전체 삭제", monitor_ref, on_done=finish_chat_wipe,
+                                  before_delete=lambda docs, wiped_room=monitor_room: archive_messages(wiped_room, docs))
+                st.toast("채팅방 기록 삭제를 시작했습니다.")
+            rc1, rc2 = st.columns([2, 3])
+            rescan_count = rc1.number_input("재검사할 최근 메시지 수", min_value=1, max_value=1000, value=MAX_CHAT_MESSAGES)
+            with rc2:
+                st.write("")
+                if st.button("🔍 금칙어 재검사", disabled=not monitor_banned_words):
+                    rescan_recent_messages(monitor_room, int(rescan_count), monitor_banned_words)
+                    st.toast("금칙어 재검사를 시작했습니다.")
             st.divider()
-            docs = chat_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
+            mf1, mf2 = st.columns([2, 2])
+            monitor_user = mf1.text_input("작성자 ID로 거르기").strip()
+            monitor_deleted = mf2.radio("상태", ["전체", "정상", "삭제됨"], horizontal=True)
+            banned_matcher = compile_banned_words(monitor_banned_words)
+            docs, has_next_docs = fetch_page(
+                build_monitor_query(monitor_room, monitor_user, monitor_deleted), "monitor_page", MONITOR_PAGE_SIZE,
+                signature=(monitor_room, monitor_user, monitor_deleted)
+            )
+            monitor_profiles = load_profiles(doc.to_dict() for doc in docs)
+            if not docs:
+                st.info("조건에 맞는 메시지가 없습니다.")
             for doc in docs:
                 data = doc.to_dict()
                 doc_id = doc.id
                 msg_id = data.get("user_id")
-                name = data.get("name")
-                msg = data.get("message")
+                name, msg_color, msg = describe_message(data, monitor_profiles)
+                msg_color = msg_color or "#000000"
                 is_deleted = data.get("is_deleted", False)
                 time_str = format_time_kst(data.get("timestamp"))
-                msg_color = data.get("color", "#000000")
 
                 with st.container(border=True):
                     if msg_id == "SYSTEM_ENTRY":
                         st.caption(f"🔔 {msg} ({time_str})")
                         if st.button("알림삭제", key=f"adm_del_{doc_id}", type="primary"):
-                             chat_ref.document(doc_id).delete()
+                             batch = db.batch()
+                             batch.delete(monitor_ref.document(doc_id))
+                             batch.set(stats_ref, stats_increment(message_count=-1), merge=True)
+                             batch.set(room_counter_ref(monitor_room), stats_increment(message_count=-1), merge=True)
+                             batch.update(system_ref.document("config"), {"chat_epoch": firestore.Increment(1)})
+                             batch.commit()
                              st.rerun()
                     else:
                         mc1, mc2 = st.columns([8, 2])
@@ -354,75 +1557,214 @@ else:
                             if is_deleted: st.caption(f"🚫 [삭제됨] {name}: {msg}")
                             else: 
                                 st.markdown(f"<span style='color:{msg_color}; font-weight:bold;'>{name}</span>: {msg}", unsafe_allow_html=True)
-                                st.caption(time_str)
+                                found_words = banned_matcher.find(msg or "")
+                                if found_words:
+                                    st.caption(f"{time_str} · ⚠️ 금칙어 포함: {', '.join(sorted(found_words))}")
+                                else:
+                                    st.caption(time_str)
                         with mc2:
                             if not is_deleted:
                                 if st.button("삭제", key=f"adm_del_{doc_id}", type="primary"):
-                                    chat_ref.document(doc_id).update({
+                                    monitor_ref.document(doc_id).update({
                                         "is_deleted": True,
-                                        "message": "🚫 관리자에 의해 삭제된 글입니다."
+                                        "message": "🚫 관리자에 의해 삭제된 글입니다.",
+                                        "updated_at": firestore.SERVER_TIMESTAMP
                                     })
                                     st.rerun()
+            if docs:
+                page_controls("monitor_page", docs, has_next_docs)
             st.divider()
-            notice_msg = st.text_input("공지 내용")
+            notice_msg = st.text_input("공지 내용 (위에서 고른 채팅방에 보냅니다)")
             if st.button("공지 전송"):
                 if notice_msg:
-                    chat_ref.add({
+                    add_chat_message({
                         "user_id": "ADMIN_ACCOUNT",
-                        "name": "📢 관리자",
                         "message": notice_msg,
                         "timestamp": firestore.SERVER_TIMESTAMP,
-                        "is_deleted": False,
-                        "color": "#FF0000"
-                    })
-                    maintain_chat_history()
+                        "is_deleted": False
+                    }, room_id=monitor_room)
+                    maintain_chat_history(monitor_room)
                     st.rerun()
 
-        with admin_tab4:
+        with admin_tab4, perf.section("admin.settings"):
             st.subheader("⚙️ 시스템 설정")
             st.markdown("### 1. 채팅방 얼리기")
-            lock_status = st.toggle("채팅방 얼리기", value=is_chat_locked)
+            lock_status = st.toggle("모든 채팅방 얼리기", value=is_chat_locked)
             if lock_status != is_chat_locked:
-                system_ref.document("config").update({"is_locked": lock_status})
+                update_system_config({"is_locked": lock_status})
                 st.rerun()
             st.divider()
             st.markdown("### 2. 금칙어 관리")
             st.caption("쉼표(,)로 구분")
             new_banned_words = st.text_area("금칙어 목록", value=banned_words, height=150)
             if st.button("금칙어 저장"):
-                system_ref.document("config").update({"banned_words": new_banned_words})
+                update_system_config({"banned_words": new_banned_words})
                 st.success("저장됨")
                 time.sleep(1)
                 st.rerun()
+            st.divider()
+            st.markdown("### 3. 채팅방 관리")
+            st.caption("방마다 보관할 메시지 수, 얼리기, 추가 금칙어를 정합니다. 위의 전체 얼리기/금칙어는 모든 방에 함께 적용됩니다.")
+            config_rooms = dict(sys_config.get("rooms") or {})
+            for r_id, r_conf in get_rooms(sys_config).items():
+                with st.expander(f"{r_conf.get('name') or r_id} ({r_id})"):
+                    r_name = st.text_input("방 이름", value=r_conf.get("name") or r_id, key=f"room_name_{r_id}")
+                    r_max = st.number_input("보관할 메시지 수", min_value=10, max_value=MAX_ROOM_MESSAGES,
+                                            value=int(r_conf.get("max_messages") or MAX_CHAT_MESSAGES), key=f"room_max_{r_id}")
+                    r_locked = st.toggle("이 방 얼리기", value=bool(r_conf.get("is_locked", False)), key=f"room_lock_{r_id}")
+                    r_words = st.text_area("이 방에만 적용할 금칙어 (쉼표로 구분)", value=r_conf.get("banned_words", ""), key=f"room_words_{r_id}")
+                    rb1, rb2 = st.columns(2)
+                    if rb1.button("저장", key=f"room_save_{r_id}"):
+                        config_rooms[r_id] = {"name": r_name.strip() or r_id, "max_messages": int(r_max), "is_locked": r_locked, "banned_words": r_words}
+                        update_system_config({"rooms": config_rooms})
+                        maintain_chat_history(r_id)
+                        st.rerun()
+                    if r_id != DEFAULT_ROOM and rb2.button("방 삭제", key=f"room_del_{r_id}", type="primary"):
+                        def finish_room_delete(deleted, deleted_room=r_id):
+                            stats_ref.set(stats_increment(message_count=-deleted), merge=True)
+                            room_counter_ref(deleted_room).delete()
+                        config_rooms.pop(r_id, None)
+                        update_system_config({"rooms": config_rooms})
+                        get_room_workers().close_stale(get_rooms({**sys_config, "rooms": config_rooms}))
+                        start_bulk_delete(f"'{r_conf.get('name') or r_id}' 방 메시지 삭제", room_chat_ref(r_id), on_done=finish_room_delete,
+                                          before_delete=lambda docs, deleted_room=r_id: archive_messages(deleted_room, docs))
+                        st.rerun()
+            nr1, nr2, nr3 = st.columns(3)
+            new_room_id = nr1.text_input("새 방 ID (영문)").strip()
+            new_room_name = nr2.text_input("새 방 이름").strip()
+            new_room_max = nr3.number_input("보관할 메시지 수", min_value=10, max_value=MAX_ROOM_MESSAGES, value=MAX_CHAT_MESSAGES)
+            if st.button("방 만들기"):
+                if room_id_error(new_room_id):
+                    st.error(room_id_error(new_room_id))
+                elif new_room_id in get_rooms(sys_config):
+                    st.error("이미 있는 방 ID입니다.")
+                else:
+                    config_rooms[new_room_id] = {"name": new_room_name or new_room_id, "max_messages": int(new_room_max), "is_locked": False, "banned_words": ""}
+                    update_system_config({"rooms": config_rooms})
+                    st.rerun()
+            st.divider()
+            st.markdown("### 4. 데이터 정리")
+            st.caption("예전 메시지에 저장된 닉네임/색상을 회원 정보로 옮기고 메시지에서는 지웁니다.")
+            if st.button("메시지 프로필 마이그레이션"):
+                start_bulk_task("메시지 프로필 마이그레이션", migrate_message_profiles)
+                st.toast("마이그레이션을 시작했습니다.")
+            st.caption("예전 회원 문서에 is_guest 필드를 채워 회원 관리의 가입 회원/익명 필터에 나오게 합니다.")
+            if st.button("회원 구분 필드 채우기"):
+                start_bulk_task("회원 구분 필드 채우기", backfill_guest_flags)
+                st.toast("작업을 시작했습니다.")
+            st.caption("닉네임 예약 목록(nicknames)이 생기기 전에 가입한 회원들의 닉네임을 예약합니다.")
+            if st.button("닉네임 예약 목록 만들기"):
+                start_bulk_task("닉네임 예약 목록 만들기", backfill_nickname_reservations)
+                st.toast("작업을 시작했습니다.")
+            st.divider()
+            st.markdown("### 5. 자동 정리 작업")
+            st.caption(f"이 서버: {get_maintenance_scheduler().owner}")
+            for task_name, interval, last_run, last_result in get_maintenance_scheduler().status():
+                last_run_str = format_time_kst(last_run) if last_run else "아직 실행 안 됨"
+                st.text(f"{task_name} (매 {interval}초) · 마지막 실행: {last_run_str} · {last_result or '-'}")
 
-        with admin_tab5:
+        with admin_tab5, perf.section("admin.inquiries"):
             st.subheader("📩 받은 문의함")
-            inquiries = inquiry_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
-            count = 0
+            unread_only = st.checkbox("안 읽은 문의만 보기")
+            inquiries, has_next_inquiries = fetch_page(
+                build_inquiry_query(unread_only), "inquiry_page", INQUIRY_PAGE_SIZE, signature=unread_only
+            )
             for iq in inquiries:
-                count += 1
                 data = iq.to_dict()
                 iq_id = iq.id
                 sender_nick = data.get("nickname", "알수없음")
                 content = data.get("message", "")
                 ts = format_time_kst(data.get("timestamp"))
                 
+                is_read = data.get("is_read", False)
+                
                 with st.container(border=True):
                     ic1, ic2 = st.columns([8, 1])
                     with ic1:
-                        st.markdown(f"**보낸이:** {sender_nick} <span style='color:gray; font-size:0.8em;'>({ts})</span>", unsafe_allow_html=True)
+                        unread_badge = "" if is_read else " 🆕"
+                        st.markdown(f"**보낸이:** {sender_nick}{unread_badge} <span style='color:gray; font-size:0.8em;'>({ts})</span>", unsafe_allow_html=True)
                         st.write(content)
                     with ic2:
+                        if not is_read and st.button("읽음", key=f"read_iq_{iq_id}"):
+                            inquiry_ref.document(iq_id).update({"is_read": True})
+                            st.rerun()
                         if st.button("처리(삭제)", key=f"del_iq_{iq_id}"):
                             inquiry_ref.document(iq_id).delete()
                             st.rerun()
-            if count == 0:
+            if not inquiries:
                 st.info("도착한 문의가 없습니다.")
+            else:
+                page_controls("inquiry_page", inquiries, has_next_inquiries)
+
+        with admin_tab6:
+            st.subheader("⏱️ 성능 측정")
+            st.caption(f"이 서버의 모든 세션에서 최근 {perf.WINDOW_SECONDS // 60}분 동안 모은 값입니다. "
+                       "'(백그라운드)'는 리스너/자동 정리/일괄 작업 스레드에서 나온 호출입니다.")
+            if st.button("측정값 초기화"):
+                perf.registry.reset()
+                st.rerun()
+
+            st.markdown("#### 화면별 실행(rerun)")
+            rerun_rows = perf.registry.rerun_summary()
+            if rerun_rows:
+                st.dataframe(rerun_rows, hide_index=True, use_container_width=True)
+            else:
+                st.info("아직 기록이 없습니다.")
+
+            st.markdown("#### 저장소 호출 / 화면 구간")
+            metric_rows = perf.registry.metric_summary()
+            if metric_rows:
+                st.dataframe(metric_rows, hide_index=True, use_container_width=True)
+
+            st.markdown("#### 읽기/쓰기가 많았던 실행")
+            for r in perf.registry.heaviest_reruns():
+                sections = ", ".join(f"{name} {ms}ms" for name, ms in sorted(r["sections"].items(), key=lambda x: -x[1]))
+                st.text(f"{format_time_kst(datetime.fromtimestamp(r['at'], timezone.utc))} · {r['label']} · "
+                        f"{r['ms']}ms · 읽기 {r['reads']} / 쓰기 {r['writes']} · {sections or '-'}")
+
+            op_counts = store.op_counts()
+            if op_counts is not None:
+                st.caption(f"메모리 저장소 누적: 읽기 {op_counts['reads']} / 쓰기 {op_counts['writes']} / 삭제 {op_counts['deletes']}")
+
+        with admin_tab7, perf.section("admin.archive"):
+            st.subheader("🗄️ 지난 메시지 보관함")
+            st.caption("보관 개수를 넘어 정리되거나 관리자가 지운 메시지입니다. 이 서버의 디스크에서 검색하므로 Firestore 읽기가 없습니다.")
+            archive_rooms = get_rooms(sys_config)
+            af1, af2, af3, af4 = st.columns(4)
+            archive_keyword = af1.text_input("내용 검색").strip()
+            archive_user = af2.text_input("작성자 ID").strip()
+            archive_nick = af3.text_input("닉네임").strip()
+            archive_room = af4.selectbox("채팅방", [None] + list(archive_rooms), key="archive_room",
+                                         format_func=lambda r: "전체" if r is None else archive_rooms.get(r, {}).get("name") or r)
+            archive_filters = {"keyword": archive_keyword or None, "user_id": archive_user or None,
+                               "nickname": archive_nick or None, "room_id": archive_room}
+            archived, has_next_archived = fetch_archive_page(archive_filters)
+            st.caption(f"검색 결과 {get_message_archive().count(**archive_filters)}개")
+            for row in archived:
+                ts = format_time_kst(datetime.fromtimestamp(row["timestamp"], timezone.utc))
+                room_name = archive_rooms.get(row["room_id"], {}).get("name") or row["room_id"]
+                deleted_mark = " · 🚫 [삭제됨]" if row["is_deleted"] else ""
+                with st.container(border=True):
+                    st.caption(f"{room_name} · {ts} · {row['user_id']}{deleted_mark}")
+                    st.text(f"{row['nickname'] or '-'}: {row['message'] or ''}")
+            if archived:
+                page_controls("archive_page", archived, has_next_archived)
+            else:
+                st.info("검색 결과가 없습니다.")
 
     # ----------------------------------------------------
     # [B-2] 일반 사용자 화면
     # ----------------------------------------------------
     else:
+        # 이 세션이 보고 있는 방과 그 방에 적용되는 설정 (전체 얼리기/금칙어 포함)
+        rooms = get_rooms(sys_config)
+        if st.session_state.room_id not in rooms:
+            st.session_state.room_id = DEFAULT_ROOM
+        room_id = st.session_state.room_id
+        room = room_settings(sys_config, room_id)
+        is_chat_locked = room["is_locked"]
+        banned_words = room["banned_words"]
+
         components.html("""
             <script>
                 function fixButtonPosition() {
@@ -457,14 +1799,21 @@ else:
         with st.sidebar:
             st.header(f"👤 {st.session_state.user_nickname}님")
             
+            st.divider()
+            st.subheader("💬 채팅방")
+            room_ids = list(rooms)
+            chosen_room = st.selectbox("채팅방 선택", room_ids, index=room_ids.index(room_id),
+                                       format_func=lambda r: rooms[r].get("name") or r, label_visibility="collapsed")
+            if chosen_room != room_id:
+                st.session_state.room_id = chosen_room
+                st.rerun()
             st.divider()
             st.subheader("🎨 프로필 색상")
             chosen_color = st.color_picker("색상 선택", st.session_state.user_color)
             if chosen_color != st.session_state.user_color:
                 st.session_state.user_color = chosen_color
-                my_docs = chat_ref.where("user_id", "==", st.session_state.user_id).stream()
-                for doc in my_docs:
-                    doc.reference.update({"color": chosen_color})
+                users_ref.document(st.session_state.user_id).update({"color": chosen_color})
+                get_profile_cache().invalidate(st.session_state.user_id)
                 st.toast("모든 채팅 기록의 색상이 변경되었습니다.")
                 time.sleep(0.5)
                 st.rerun()
@@ -478,18 +1827,11 @@ else:
                     if st.button("저장"):
                         clean_nick = change_nick.strip()
                         if clean_nick and clean_nick != st.session_state.user_nickname:
-                            check_dup = users_ref.where("nickname", "==", clean_nick).limit(1).get()
-                            if len(check_dup) > 0:
-                                st.error("⚠️ 이미 존재하는 닉네임입니다.")
+                            rename_error = change_nickname(st.session_state.user_id, clean_nick)
+                            if rename_error:
+                                st.error(f"⚠️ {rename_error}")
                             else:
-                                users_ref.document(st.session_state.user_id).update({"nickname": clean_nick})
-                                my_msgs = chat_ref.where("user_id", "==", st.session_state.user_id).stream()
-                                for msg in my_msgs: msg.reference.update({"name": clean_nick})
-                                sys_msgs = chat_ref.where("user_id", "==", "SYSTEM_ENTRY")\
-                                                   .where("related_user_id", "==", st.session_state.user_id)\
-                                                   .stream()
-                                for s_msg in sys_msgs:
-                                    s_msg.reference.update({"message": f"👋 {clean_nick}님이 입장했습니다."})
+                                get_profile_cache().invalidate(st.session_state.user_id)
                                 st.session_state.user_nickname = clean_nick
                                 st.toast("닉네임 변경 완료. 입장 알림도 수정되었습니다.")
                                 time.sleep(1)
@@ -515,86 +1857,109 @@ else:
             st.divider()
             if st.button("🚪 로그아웃"):
                 if st.session_state.user_id.startswith("guest_"):
-                    users_ref.document(st.session_state.user_id).delete()
+                    delete_user(st.session_state.user_id, st.session_state.user_nickname)
+                    stats_ref.set(stats_increment(guest_count=-1), merge=True)
                 
                 st.session_state.logged_in = False
                 st.rerun()
             st.caption("문의사항은 위 '관리자에게 문의하기'를 이용해주세요.")
 
         st.title("💬 정동고 익명 채팅방")
+        st.caption(f"📍 {room['name']}")
         
-        if is_chat_locked:
-            st.error("🔒 현재 관리자가 채팅방을 얼렸습니다.")
+        # 채팅 목록만 주기적으로 다시 그린다 (공유 버퍼에서 읽으므로 Firestore 조회 없음)
+        @st.fragment(run_every=CHAT_REFRESH_INTERVAL)
+        @perf.timed("chat_room", standalone=True)
+        def render_chat_room():
+            live_config = get_system_config()
+            # 얼리기 상태가 바뀌었거나, 방이 없어졌거나, 추방된 경우 전체를 다시 실행해서 입력창/접속 상태를 갱신
+            if room_id not in get_rooms(live_config) or room_settings(live_config, room_id)["is_locked"] != is_chat_locked:
+                st.rerun()
+            if not user_exists(st.session_state.user_id):
+                st.rerun()
+            if is_chat_locked:
+                st.error("🔒 현재 관리자가 채팅방을 얼렸습니다.")
 
-        docs = chat_ref.order_by("timestamp").stream()
-        chat_exists = False
+            chat_messages = get_chat_messages(room_id, live_config)
+            profiles = load_profiles(chat_messages.values())
+            pending_sends = visible_pending_sends(room_id, chat_messages)
+            chat_exists = False
         
-        for doc in docs:
-            chat_exists = True
-            data = doc.to_dict()
-            doc_id = doc.id
-            msg_id = data.get("user_id")
-            msg_name = data.get("name")
-            msg_text = data.get("message")
-            msg_time = format_time_kst(data.get("timestamp"))
-            is_deleted = data.get("is_deleted", False)
-            msg_color = data.get("color", "#000000")
+            if CHAT_RENDER_MODE == "batch":
+                blocks = []
+                avatars = {}
+                for doc_id, data in chat_messages.items():
+                    parts = render_message_parts(doc_id, data, profiles)
+                    is_self = data.get("user_id") == st.session_state.user_id
+                    blocks.append(render_message_block(doc_id, data, parts, is_self))
+                    if not is_self and "avatar_class" in parts:
+                        avatars[parts["avatar_class"]] = parts["avatar"]
+                blocks.extend(render_pending_block(p) for p in pending_sends)
+                if not blocks:
+                    blocks.append("<div class='empty'>대화가 없습니다.</div>")
+
+                action = chat_list_component(html="".join(blocks), avatars=avatars, key="chat_list", default=None)
+                # 컴포넌트 값은 다음 실행에도 남아 있으므로 nonce로 한 번만 처리
+                if action and action.get("nonce") != st.session_state.get("chat_action_nonce"):
+                    st.session_state.chat_action_nonce = action.get("nonce")
+                    target = chat_messages.get(action.get("doc_id"))
+                    if action.get("type") == "delete" and target and target.get("user_id") == st.session_state.user_id:
+                        room_chat_ref(room_id).document(action["doc_id"]).update({"is_deleted": True, "updated_at": firestore.SERVER_TIMESTAMP})
+                        st.rerun()
+                show_failed_sends(pending_sends)
+                return
+
+            for doc_id, data in chat_messages.items():
+                chat_exists = True
+                msg_id = data.get("user_id")
+                parts = render_message_parts(doc_id, data, profiles)
+                is_deleted = parts["is_deleted"]
             
-            if msg_id == "SYSTEM_ENTRY":
-                st.markdown(f"""
-                <div style='text-align:center; color:#888; font-size:0.8em; margin: 10px 0;'>
-                    {msg_text} ({msg_time})
-                </div>
-                """, unsafe_allow_html=True)
-                continue 
-
-            if is_deleted:
+                if msg_id == "SYSTEM_ENTRY":
+                    st.markdown(parts["html"], unsafe_allow_html=True)
+                    continue 
+
                 if msg_id == "ADMIN_ACCOUNT":
-                    display_text = "🚫 관리자에 의해 삭제된 공지입니다."
-                elif msg_text == "🚫 관리자에 의해 삭제된 글입니다.":
-                    display_text = "🚫 관리자에 의해 삭제된 글입니다."
-                else:
-                    display_text = f"🗑️ {msg_name}님이 삭제한 글입니다."
-                
-                text_html = f"""<div style='color:#888;font-style:italic;'>{display_text}</div>
-                                <div style='display:block;text-align:right;font-size:0.7em;color:grey;'>{msg_time}</div>"""
-            else:
-                text_html = f"""{msg_text}<div style='display:block;text-align:right;font-size:0.7em;color:grey;'>{msg_time}</div>"""
+                    with st.chat_message("admin", avatar="📢"):
+                        if is_deleted: st.markdown(parts["html"], unsafe_allow_html=True)
+                        else: st.error(parts["notice"]) 
             
-            if msg_id == "ADMIN_ACCOUNT":
-                with st.chat_message("admin", avatar="📢"):
-                    if is_deleted: st.markdown(text_html, unsafe_allow_html=True)
-                    else: st.error(f"**[공지] {msg_text}**") 
-            
-            elif msg_id == st.session_state.user_id:
+                elif msg_id == st.session_state.user_id:
+                    with st.chat_message("user"):
+                        col_msg, col_del = st.columns([9, 1])
+                        with col_msg: st.markdown(parts["html"], unsafe_allow_html=True)
+                        with col_del:
+                            if not is_deleted:
+                                if st.button("🗑️", key=f"my_del_{doc_id}", help="삭제"):
+                                    room_chat_ref(room_id).document(doc_id).update({"is_deleted": True, "updated_at": firestore.SERVER_TIMESTAMP})
+                                    st.rerun()
+
+                else:
+                    with st.chat_message(parts["name"], avatar=parts["avatar"]):
+                        if not is_deleted: 
+                            st.markdown(parts["name_html"], unsafe_allow_html=True)
+                        st.markdown(parts["html"], unsafe_allow_html=True)
+
+            for p in pending_sends:
                 with st.chat_message("user"):
-                    col_msg, col_del = st.columns([9, 1])
-                    with col_msg: st.markdown(text_html, unsafe_allow_html=True)
-                    with col_del:
-                        if not is_deleted:
-                            if st.button("🗑️", key=f"my_del_{doc_id}", help="삭제"):
-                                chat_ref.document(doc_id).update({"is_deleted": True})
-                                st.rerun()
+                    st.text(p.data.get("message", ""))
+                    st.caption("⚠️ 전송 실패" if p.status == "failed" else "전송 중…")
 
-            else:
-                with st.chat_message(msg_name, avatar=get_custom_avatar(msg_id, msg_color)):
-                    if not is_deleted: 
-                        st.markdown(f"<span style='color:{msg_color}; font-weight:bold;'>{msg_name}</span>", unsafe_allow_html=True)
-                    st.markdown(text_html, unsafe_allow_html=True)
+            if not chat_exists and not pending_sends: st.info("대화가 없습니다.")
+            show_failed_sends(pending_sends)
 
-        if not chat_exists: st.info("대화가 없습니다.")
+        render_chat_room()
             
         if prompt := st.chat_input("메시지 입력...", disabled=is_chat_locked):
             filtered_msg = filter_message(prompt, banned_words)
             
-            chat_ref.add({
+            # 화면에는 바로 보여 주고, 저장은 전송 큐가 다른 세션의 메시지와 묶어서 처리
+            st.session_state.pending_sends.append(get_send_queue().submit(room_id, {
                 "user_id": st.session_state.user_id,
-                "name": st.session_state.user_nickname,
                 "message": filtered_msg,
                 "timestamp": firestore.SERVER_TIMESTAMP,
-                "is_deleted": False,
-                "color": st.session_state.user_color 
-            })
-            
-            maintain_chat_history()
+                "is_deleted": False
+            }))
             st.rerun()
+
+perf.end_rerun()
@@ -0,0 +1,112 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    room_id TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    user_id TEXT,
+    nickname TEXT,
+    message TEXT,
+    timestamp REAL NOT NULL,
+    is_deleted INTEGER NOT NULL DEFAULT 0,
+    archived_at REAL NOT NULL,
+    PRIMARY KEY (room_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (timestamp);
+"""
+
+# 전문 검색 색인. trigram은 한국어처럼 띄어쓰기 단위가 아닌 부분 문자열 검색에 맞다 (3글자 이상)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    message, nickname, content='messages', content_rowid='rowid', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, message, nickname) VALUES (new.rowid, new.message, new.nickname);
+END;
+"""
+FTS_MIN_LENGTH = 3
+
+
+class MessageArchive:
+    # 정리(삭제)되는 메시지를 서버 디스크의 SQLite 파일에 쌓아 두는 추가 전용 보관소
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self.fts = self._create_fts()
+
+    def _create_fts(self):
+        # FTS5가 없는 SQLite 빌드면 LIKE 검색으로 대신한다
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self._conn.executescript(FTS_SCHEMA.format(tokenizer=tokenizer))
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        logging.getLogger(__name__).warning("SQLite FTS5를 쓸 수 없어 보관함 검색에 LIKE를 사용합니다")
+        return None
+
+    def add_many(self, rows):
+        # rows: room_id, doc_id, user_id, nickname, message, timestamp(datetime), is_deleted 를 가진 dict
+        now = time.time()
+        values = [(
+            row["room_id"], row["doc_id"], row.get("user_id"), row.get("nickname"), row.get("message"),
+            # 서버 시각이 아직 없는 문서는 보관 시각으로 대신한다 (정렬/커서에 NULL이 끼지 않게)
+            row["timestamp"].timestamp() if row.get("timestamp") else now,
+            1 if row.get("is_deleted") else 0, now,
+        ) for row in rows]
+        if not values:
+            return 0
+        with self._lock, self._conn:
+            # 같은 메시지를 두 번 보관하려 하면(정리 재시도 등) 처음 것을 남긴다
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO messages (room_id, doc_id, user_id, nickname, message, timestamp, is_deleted, archived_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+        return cursor.rowcount
+
+    def _where(self, keyword, user_id, nickname, room_id):
+        clauses, params = [], []
+        if keyword:
+            if self.fts == "trigram" and len(keyword) >= FTS_MIN_LENGTH or self.fts == "unicode61":
+                clauses.append("m.rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+                params.append('message : "{}"'.format(keyword.replace('"', '""')))
+            else:
+                clauses.append("m.message LIKE ? ESCAPE '\\'")
+                params.append("%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if user_id:
+            clauses.append("m.user_id = ?")
+            params.append(user_id)
+        if nickname:
+            clauses.append("m.nickname = ?")
+            params.append(nickname)
+        if room_id:
+            clauses.append("m.room_id = ?")
+            params.append(room_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def search(self, keyword=None, user_id=None, nickname=None, room_id=None, limit=20, after=None):
+        # 최신순. after는 이전 페이지의 마지막 결과(커서)이고, (결과, 다음 페이지 여부)를 돌려준다
+        where, params = self._where(keyword, user_id, nickname, room_id)
+        if after is not None:
+            where += (" AND " if where else " WHERE ") + "(m.timestamp, m.rowid) < (?, ?)"
+            params += [after["timestamp"], after["rowid"]]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT m.rowid AS rowid, m.* FROM messages m{where} ORDER BY m.timestamp DESC, m.rowid DESC LIMIT ?",
+                params + [limit + 1]).fetchall()
+        return [dict(row) for row in rows[:limit]], len(rows) > limit
+
+    def count(self, keyword=None, user_id=None, nickname=None, room_id=None):
+        where, params = self._where(keyword, user_id, nickname, room_id)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM messages m{where}", params).fetchone()[0]
@@ -0,0 +1,60 @@
+# 금칙어 필터 마이크로 벤치마크: python benchmarks/bench_word_filter.py
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from word_filter import BannedWordMatcher, compile_banned_words
+
+
+def legacy_filter_message(text, banned_words_str):
+    # 컴파일 도입 전 app.py의 filter_message
+    if not banned_words_str: return text
+    words = [w.strip() for w in banned_words_str.split(",") if w.strip()]
+    for word in words:
+        if word in text: text = text.replace(word, "*" * len(word))
+    return text
+
+
+def make_words(count, rng):
+    letters = string.ascii_lowercase + "가나다라마바사아자차카타파하"
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+def make_messages(words, count, rng):
+    filler = "안녕하세요 오늘 급식 뭐예요 ㅋㅋㅋ 수행평가 언제까지 hello world ".split()
+    messages = []
+    for _ in range(count):
+        parts = [rng.choice(filler) for _ in range(rng.randint(3, 12))]
+        if rng.random() < 0.2:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(words))
+        messages.append(" ".join(parts))
+    return messages
+
+
+def main():
+    rng = random.Random(42)
+    for word_count in (1000, 10000):
+        words = make_words(word_count, rng)
+        banned = ",".join(words)
+        messages = make_messages(words, 200, rng)
+
+        matcher = BannedWordMatcher(banned)
+        for msg in messages:
+            assert matcher.filter(msg) == legacy_filter_message(msg, banned)
+
+        build = timeit.timeit(lambda: BannedWordMatcher(banned), number=3) / 3
+        compile_banned_words(banned)
+        legacy = timeit.timeit(lambda: [legacy_filter_message(m, banned) for m in messages], number=3) / 3
+        compiled = timeit.timeit(lambda: [compile_banned_words(banned).filter(m) for m in messages], number=3) / 3
+        print(f"[{word_count:>5} words] build {build * 1000:8.2f} ms | "
+              f"legacy {legacy / len(messages) * 1e6:9.1f} us/msg | "
+              f"compiled {compiled / len(messages) * 1e6:9.1f} us/msg | "
+              f"x{legacy / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    main()
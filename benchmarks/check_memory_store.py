@@ -0,0 +1,137 @@
+# 메모리 저장소 자체 점검: python benchmarks/check_memory_store.py
+# 부하 테스트가 메모리 저장소의 결과와 읽기/쓰기 횟수를 믿을 수 있도록, 앱이 기대하는 Firestore 동작
+# (쿼리/커서, 배치 원자성, 특수 값, 트랜잭션, 하위 컬렉션, 리스너 변경 알림, 횟수 세기)을 확인한다.
+# load_test.py도 시작할 때 한 번 실행한다.
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from firebase_admin import firestore
+
+from datastore import DEFAULT_ROOM, DOCUMENT_ID, AlreadyExists, MemoryStore, NotFound
+
+LISTENER_TIMEOUT = 5
+
+
+def check_queries(store, rng):
+    ref = store.db.collection("check_queries")
+    rows = {f"d{i:03d}": {"n": rng.randint(0, 20), "tag": rng.choice("abc")} for i in range(120)}
+    for doc_id, data in rows.items():
+        ref.document(doc_id).set(data)
+
+    # 범위 조건 + 정렬 + 커서 페이지 넘기기를 파이썬 정렬 결과와 비교
+    # (같은 값은 Firestore처럼 마지막 정렬 방향을 따라 문서 ID 역순)
+    expected = [doc_id for doc_id, data in sorted(rows.items(), key=lambda item: (item[1]["n"], item[0]), reverse=True)
+                if data["tag"] == "a" and data["n"] >= 5]
+    query = ref.where("tag", "==", "a").where("n", ">=", 5).order_by("n", direction="DESCENDING")
+    paged, cursor = [], None
+    while True:
+        page = query.start_after(cursor).limit(7).get() if cursor else query.limit(7).get()
+        paged += [snap.id for snap in page]
+        if len(page) < 7:
+            break
+        cursor = page[-1]
+    assert paged == expected, "커서 페이지 결과가 정렬 결과와 다름"
+
+    # 문서 ID 범위 조건(접두어 검색)과 select([])
+    prefix = [snap.id for snap in ref.where(DOCUMENT_ID, ">=", ref.document("d05")).where(
+        DOCUMENT_ID, "<", ref.document("d06")).order_by(DOCUMENT_ID).stream()]
+    assert prefix == [f"d{i:03d}" for i in range(50, 60)], prefix
+    assert all(snap.to_dict() == {} for snap in ref.limit(5).select([]).stream())
+    assert ref.where("tag", "in", ["b", "c"]).count().get()[0][0].value == sum(
+        1 for data in rows.values() if data["tag"] in ("b", "c"))
+
+
+def check_writes(store):
+    ref = store.db.collection("check_writes")
+    ref.document("a").set({"n": 1, "drop": True})
+
+    # 배치는 전부 반영되거나 전혀 반영되지 않는다
+    batch = store.db.batch()
+    batch.set(ref.document("b"), {"n": 2})
+    batch.create(ref.document("a"), {"n": 9})
+    try:
+        batch.commit()
+        raise AssertionError("이미 있는 문서에 create가 성공함")
+    except AlreadyExists:
+        pass
+    assert not ref.document("b").get().exists, "실패한 배치의 쓰기가 반영됨"
+    try:
+        ref.document("missing").update({"n": 1})
+        raise AssertionError("없는 문서에 update가 성공함")
+    except NotFound:
+        pass
+
+    # 특수 값: Increment(merge), SERVER_TIMESTAMP, DELETE_FIELD
+    ref.document("a").set({"n": firestore.Increment(4), "drop": firestore.DELETE_FIELD,
+                           "at": firestore.SERVER_TIMESTAMP}, merge=True)
+    data = ref.document("a").get().to_dict()
+    assert data["n"] == 5 and "drop" not in data and isinstance(data["at"], datetime), data
+    ref.document("a").set({"n": firestore.Increment(1)})
+    assert ref.document("a").get().to_dict() == {"n": 1}, "merge 없는 set은 문서를 덮어써야 함"
+
+    # 트랜잭션: 안에서 읽은 값으로 쓰고, 쓰기는 끝에서 한꺼번에 반영
+    def bump(transaction, doc_ref):
+        current = doc_ref.get(transaction=transaction).to_dict()["n"]
+        transaction.update(doc_ref, {"n": current + 10})
+        assert doc_ref.get(transaction=transaction).to_dict()["n"] == current, "트랜잭션 쓰기가 커밋 전에 보임"
+        return current
+    assert store.run_transaction(bump, ref.document("a")) == 1
+    assert ref.document("a").get().to_dict()["n"] == 11
+
+    # 방 하위 컬렉션은 기본 방 컬렉션과 섞이지 않는다
+    store.room_messages("check_room").document("m").set({"timestamp": 1})
+    assert store.room_messages("check_room").count().get()[0][0].value == 1
+    assert store.room_messages(DEFAULT_ROOM).count().get()[0][0].value == 0
+
+
+def check_listener(store):
+    ref = store.db.collection("check_listener")
+    events = queue.Queue()
+    watch = ref.order_by("t", direction="DESCENDING").limit(2).on_snapshot(
+        lambda docs, changes, read_time: events.put(([d.id for d in docs], sorted((c.type.name, c.document.id) for c in changes))))
+
+    def next_event():
+        return events.get(timeout=LISTENER_TIMEOUT)
+
+    assert next_event() == ([], [])
+    ref.document("x").set({"t": 1})
+    assert next_event() == (["x"], [("ADDED", "x")])
+    ref.document("y").set({"t": 2})
+    assert next_event() == (["y", "x"], [("ADDED", "y")])
+    ref.document("x").set({"t": 1, "edited": True})
+    assert next_event() == (["y", "x"], [("MODIFIED", "x")])
+    # limit 밖으로 밀려난 문서는 REMOVED로 알린다
+    ref.document("z").set({"t": 3})
+    assert next_event() == (["z", "y"], [("ADDED", "z"), ("REMOVED", "x")])
+    watch.unsubscribe()
+
+
+def check_counts():
+    store = MemoryStore()
+    ref = store.db.collection("check_counts")
+    for i in range(5):
+        ref.document(str(i)).set({"i": i})
+    ref.document("0").delete()
+    ref.document("1").get()
+    list(ref.stream())
+    list(ref.where("i", ">", 100).stream())
+    # 문서 쓰기 5, 삭제 1, 읽기: 문서 1 + 쿼리 결과 4 + 빈 쿼리 1
+    assert store.op_counts() == {"reads": 6, "writes": 5, "deletes": 1}, store.op_counts()
+
+
+def run_checks(seed=0):
+    store = MemoryStore()
+    check_queries(store, random.Random(seed))
+    check_writes(store)
+    check_listener(store)
+    check_counts()
+
+
+if __name__ == "__main__":
+    run_checks()
+    print("메모리 저장소 점검 통과")
@@ -0,0 +1,267 @@
+# 동시 접속 부하 테스트: python benchmarks/load_test.py --sessions 200 --workers 8
+# Streamlit AppTest로 app.py를 세션마다 따로 실행하고, 저장소는 메모리 백엔드를 쓴다.
+# 단계(로그인 → 전송 → 새로고침 → 색상 변경 → 관리자 통계)마다 모든 세션이 같은 동작을 하고,
+# 동작별 지연 시간 백분위와 저장소 읽기/쓰기 횟수를 JSON으로 남긴다.
+# --baseline 이전결과.json 을 주면 동작별 p50/p90과 읽기/쓰기 변화를 같이 출력한다.
+# 실패한 호출이 하나라도 있으면 결과는 남기되 종료 코드 1로 끝난다.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ["CHAT_DATA_BACKEND"] = "memory"
+
+from streamlit.testing.v1 import AppTest
+
+from check_memory_store import run_checks
+from datastore import open_store
+
+APP_PATH = os.path.join(ROOT, "app.py")
+ADMIN_PASSWORD = "bench-admin"
+USER_PASSWORD = "bench1234"
+# AppTest는 실행할 때마다 프로세스 전역 Runtime을 바꿔 끼우므로 스크립트 실행은 한 번에 하나씩만 할 수 있다.
+# 여러 작업자 스레드는 세션 순서를 섞는 역할만 하고, 앱의 백그라운드 스레드(전송 큐, 리스너, 정리)는 그대로 동시에 돈다
+APPTEST_LOCK = threading.Lock()
+
+
+def new_session():
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.secrets["admin_password"] = ADMIN_PASSWORD
+    return at
+
+
+def find_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"버튼 없음: {label}")
+
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+class Session:
+    def __init__(self, index, registered):
+        self.index = index
+        self.registered = registered
+        self.user_id = f"bench{index:04d}"
+        self.at = new_session()
+
+    def open(self):
+        self.at.run()
+        check(self.at)
+
+    def signup(self):
+        at = self.at
+        at.text_input(key="new_id").input(self.user_id)
+        at.text_input(key="new_pw").input(USER_PASSWORD)
+        at.text_input(key="new_nick").input(f"벤치{self.index}")
+        find_button(at, "회원가입").click().run()
+        check(at)
+
+    def login(self):
+        at = self.at
+        if self.registered:
+            at.text_input(key="login_id").input(self.user_id)
+            at.text_input(key="login_pw").input(USER_PASSWORD)
+            find_button(at, "로그인 하기").click().run()
+        else:
+            find_button(at, "🕵️ 익명으로 바로 입장하기").click().run()
+        check(at)
+        if not at.session_state["logged_in"]:
+            raise RuntimeError("로그인 실패")
+
+    def send(self, n):
+        self.at.chat_input[0].set_value(f"부하 테스트 메시지 {self.index}-{n}").run()
+        check(self.at)
+
+    def refresh(self):
+        self.at.run()
+        check(self.at)
+
+    def change_color(self):
+        self.at.color_picker[0].pick(f"#{(self.index * 7919) % 0xFFFFFF:06x}").run()
+        check(self.at)
+
+
+def admin_login(at):
+    at.run()
+    at.text_input(key="login_id").input("admin")
+    at.text_input(key="login_pw").input(ADMIN_PASSWORD)
+    find_button(at, "로그인 하기").click().run()
+    check(at)
+
+
+def admin_stats(at):
+    # 통계 탭은 관리자 화면을 다시 그릴 때마다 계산된다
+    at.run()
+    check(at)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self.actions = {}
+
+    def phase(self, name, calls, workers):
+        # calls를 workers개 스레드로 실행한다. 동작별 읽기/쓰기는 성공한 호출이 실행되는 동안 늘어난 양만 평균 낸다
+        latencies = []
+        errors = []
+        succeeded = {}
+        before = self._store.op_counts()
+
+        def timed(call):
+            with APPTEST_LOCK:
+                call_before = self._store.op_counts()
+                start = time.perf_counter()
+                try:
+                    call()
+                except Exception as e:
+                    with self._lock:
+                        errors.append(f"{type(e).__name__}: {e}")
+                    if len(errors) == 1:
+                        traceback.print_exc()
+                    return
+                elapsed = (time.perf_counter() - start) * 1000
+                call_after = self._store.op_counts()
+            with self._lock:
+                latencies.append(elapsed)
+                for kind in call_after:
+                    succeeded[kind] = succeeded.get(kind, 0) + call_after[kind] - call_before[kind]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(timed, calls))
+        wall = time.perf_counter() - started
+
+        after = self._store.op_counts()
+        latencies.sort()
+        count = len(calls)
+        ok = len(latencies)
+        result = {
+            "count": count,
+            "errors": len(errors),
+            "wall_s": round(wall, 3),
+            "p50_ms": percentile(latencies, 0.50),
+            "p90_ms": percentile(latencies, 0.90),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": latencies[-1] if latencies else None,
+        }
+        for kind in after:
+            # total은 단계 전체(백그라운드 포함), per_action은 성공한 호출만
+            result[f"{kind}_total"] = after[kind] - before[kind]
+            result[f"{kind}_per_action"] = round(succeeded.get(kind, 0) / ok, 2) if ok else None
+        for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"):
+            if result[key] is not None:
+                result[key] = round(result[key], 1)
+        if errors:
+            result["first_error"] = errors[0]
+        self.actions[name] = result
+        print(f"{name:<12} n={count:<5} err={len(errors):<3} p50={result['p50_ms']}ms p90={result['p90_ms']}ms "
+              f"p99={result['p99_ms']}ms reads/op={result['reads_per_action']} writes/op={result['writes_per_action']}")
+        return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(actions, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["actions"]
+    print(f"\n기준 결과({baseline_path})와 비교")
+    for name, result in actions.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        parts = []
+        for key in ("p50_ms", "p90_ms", "reads_per_action", "writes_per_action"):
+            if result.get(key) is not None and old.get(key):
+                parts.append(f"{key} {old[key]} → {result[key]} ({result[key] / old[key] - 1:+.0%})")
+        print(f"{name:<12} " + " | ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="채팅 앱 동시 접속 부하 테스트 (메모리 저장소)")
+    parser.add_argument("--sessions", type=int, default=50, help="동시에 접속하는 세션 수")
+    parser.add_argument("--workers", type=int, default=8, help="세션 작업자 스레드 수 (스크립트 실행 자체는 한 번에 하나씩)")
+    parser.add_argument("--registered", type=float, default=0.3, help="가입 회원 비율 (나머지는 익명 입장)")
+    parser.add_argument("--messages", type=int, default=3, help="세션당 보낼 메시지 수")
+    parser.add_argument("--refreshes", type=int, default=3, help="세션당 새로고침 횟수")
+    parser.add_argument("--admin-refreshes", type=int, default=5, help="관리자 통계 화면 새로고침 횟수")
+    parser.add_argument("--out", default=None, help="결과 JSON 경로 (기본: benchmarks/results/load_<시각>.json)")
+    parser.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    args = parser.parse_args()
+
+    # 측정 전에 메모리 저장소가 Firestore처럼 동작하는지 먼저 확인 (점검용 저장소는 따로 만든다)
+    run_checks()
+    store = open_store("memory")
+    recorder = Recorder(store)
+    registered_count = int(args.sessions * args.registered)
+    sessions = [Session(i, i < registered_count) for i in range(args.sessions)]
+
+    recorder.phase("open", [s.open for s in sessions], args.workers)
+    recorder.phase("signup", [s.signup for s in sessions if s.registered], args.workers)
+    recorder.phase("login", [s.login for s in sessions], args.workers)
+    for n in range(args.messages):
+        recorder.phase(f"send_{n + 1}", [lambda s=s, n=n: s.send(n) for s in sessions], args.workers)
+    for n in range(args.refreshes):
+        recorder.phase(f"refresh_{n + 1}", [s.refresh for s in sessions], args.workers)
+    recorder.phase("color", [s.change_color for s in sessions], args.workers)
+    admin = new_session()
+    recorder.phase("admin_login", [lambda: admin_login(admin)], 1)
+    recorder.phase("admin_stats", [lambda: admin_stats(admin)] * args.admin_refreshes, 1)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "sessions": args.sessions,
+            "workers": args.workers,
+            "registered": registered_count,
+            "messages_per_session": args.messages,
+            "refreshes_per_session": args.refreshes,
+        },
+        "actions": recorder.actions,
+        "totals": store.op_counts(),
+    }
+    out = args.out or os.path.join(ROOT, "benchmarks", "results",
+                                   f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {out}")
+
+    if args.baseline:
+        compare(recorder.actions, args.baseline)
+
+    failed = {name: result["errors"] for name, result in recorder.actions.items() if result["errors"]}
+    if failed:
+        print("\n실패한 단계: " + ", ".join(f"{name} {n}회" for name, n in failed.items()))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# 시작/재실행 시간 측정: python benchmarks/startup_bench.py --runs 5
+# 실행마다 새 프로세스를 띄워서
+#   1) 무거운 모듈을 처음 import하는 시간 (컨테이너 첫 시작에 그대로 더해진다)
+#   2) 첫 화면(로그인) 첫 실행 / 다시 실행, 익명 입장, 로그인한 뒤 재실행 시간
+# 을 잰다 (메모리 저장소 사용).
+# streamlit은 streamlit.components.v1을, firebase_admin.firestore는 bcrypt를 이미 함께 불러오므로
+# 두 모듈은 따로 재지 않는다 (앱에서 늦게 불러와도 시작 시간이 줄지 않는다).
+# --baseline 이전결과.json 을 주면 항목별 중앙값 변화를 같이 출력한다.
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+
+HEAVY_MODULES = ["streamlit", "firebase_admin.firestore"]
+
+
+def measure_imports():
+    import importlib
+    result = {}
+    for name in HEAVY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        result[f"import {name}"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def measure_app(user_reruns):
+    result = {}
+    start = time.perf_counter()
+    from load_test import Session, check, new_session
+    result["import streamlit.testing"] = (time.perf_counter() - start) * 1000
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return (time.perf_counter() - start) * 1000
+
+    session = Session(0, registered=False)
+    result["login_first_run"] = timed(session.open)
+    result["login_rerun"] = timed(session.refresh)
+    result["guest_enter"] = timed(session.login)
+    result["user_rerun"] = statistics.median(timed(session.refresh) for _ in range(user_reruns))
+
+    # 다른 세션의 첫 실행: 프로세스 단위 캐시(저장소, 참조, 리스너)가 이미 있는 상태
+    other = new_session()
+    result["second_session_first_run"] = timed(lambda: (other.run(), check(other)))
+    return result
+
+
+def run_child(mode, user_reruns, archive_path):
+    env = dict(os.environ, CHAT_DATA_BACKEND="memory", CHAT_ARCHIVE_PATH=archive_path)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--user-reruns", str(user_reruns)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples):
+    rows = {}
+    for key in samples[0]:
+        values = sorted(s[key] for s in samples)
+        rows[key] = {"median_ms": round(statistics.median(values), 1), "max_ms": round(values[-1], 1)}
+    return rows
+
+
+def compare(timings, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["timings"]
+    print(f"\n기준 결과({baseline_path})와 비교")
+    for key, row in timings.items():
+        old = baseline.get(key)
+        if old and old["median_ms"]:
+            print(f"{key:<32} {old['median_ms']}ms → {row['median_ms']}ms ({row['median_ms'] / old['median_ms'] - 1:+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="채팅 앱 시작/재실행 시간 측정 (메모리 저장소)")
+    parser.add_argument("--runs", type=int, default=5, help="새 프로세스로 반복할 횟수")
+    parser.add_argument("--user-reruns", type=int, default=5, help="로그인한 뒤 재실행 횟수 (중앙값 사용)")
+    parser.add_argument("--out", default=None, help="결과 JSON 경로 (기본: benchmarks/results/startup_<시각>.json)")
+    parser.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    parser.add_argument("--child", choices=["imports", "app"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "imports":
+        print(json.dumps(measure_imports()))
+        return
+    if args.child == "app":
+        print(json.dumps(measure_app(args.user_reruns)))
+        return
+
+    os.makedirs(os.path.join(BENCH_DIR, "results"), exist_ok=True)
+    import_samples, app_samples = [], []
+    # 앱이 만드는 메시지 보관함(SQLite와 -wal/-shm 파일)은 임시 폴더에 두고 끝나면 지운다
+    scratch = tempfile.mkdtemp(prefix="chat_startup_bench_")
+    try:
+        for n in range(args.runs):
+            archive_path = os.path.join(scratch, f"archive_{n}.db")
+            import_samples.append(run_child("imports", args.user_reruns, archive_path))
+            app_samples.append(run_child("app", args.user_reruns, archive_path))
+            print(f"{n + 1}/{args.runs} 완료")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    timings = {**summarize(import_samples), **summarize(app_samples)}
+    for key, row in timings.items():
+        print(f"{key:<32} 중앙값 {row['median_ms']}ms / 최대 {row['max_ms']}ms")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "runs": args.runs,
+            "user_reruns": args.user_reruns,
+        },
+        "timings": timings,
+    }
+    out = args.out or os.path.join(BENCH_DIR, "results", f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {out}")
+
+    if args.baseline:
+        compare(timings, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
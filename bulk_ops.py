@@ -0,0 +1,154 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Firestore WriteBatch 한 번에 담을 수 있는 최대 쓰기 수
+BATCH_LIMIT = 500
+# 삭제 진행 상황을 알리는 간격(문서 수)
+PROGRESS_EVERY = 200
+
+
+def batched_update(db, docs, make_update, on_progress=None):
+    # docs를 돌면서 make_update(doc)가 돌려준 필드를 500개씩 묶어 커밋
+    batch = db.batch()
+    pending = 0
+    done = 0
+    for doc in docs:
+        fields = make_update(doc)
+        if not fields:
+            continue
+        batch.update(doc.reference, fields)
+        pending += 1
+        if pending == BATCH_LIMIT:
+            batch.commit()
+            done += pending
+            pending = 0
+            batch = db.batch()
+            if on_progress: on_progress(done)
+    if pending:
+        batch.commit()
+        done += pending
+        if on_progress: on_progress(done)
+    return done
+
+
+def bulk_delete(db, query, on_progress=None, before_delete=None):
+    # 문서 ID만 읽어서 BulkWriter로 삭제. BulkWriter가 배치를 나눠 여러 요청을 동시에 보낸다.
+    # before_delete(docs)가 있으면 문서 전체를 읽어 500개씩 먼저 넘긴다 (보관 등). 예외가 나면 그 묶음은 지우지 않는다
+    lock = threading.Lock()
+    done = [0]
+
+    def on_result(reference, result, bulk_writer):
+        with lock:
+            done[0] += 1
+            count = done[0]
+        if on_progress and count % PROGRESS_EVERY == 0:
+            on_progress(count)
+
+    writer = db.bulk_writer()
+    writer.on_write_result(on_result)
+    try:
+        if before_delete is None:
+            for doc in query.select([]).stream():
+                writer.delete(doc.reference)
+        else:
+            chunk = []
+            for doc in query.stream():
+                chunk.append(doc)
+                if len(chunk) == BATCH_LIMIT:
+                    before_delete(chunk)
+                    for d in chunk:
+                        writer.delete(d.reference)
+                    chunk = []
+            if chunk:
+                before_delete(chunk)
+                for d in chunk:
+                    writer.delete(d.reference)
+    finally:
+        # 중간에 실패해도 이미 넘긴 삭제는 마저 보낸다
+        writer.close()
+    if on_progress: on_progress(done[0])
+    return done[0]
+
+
+class BulkJob:
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.done = 0
+        self.status = "running"
+        self.error = None
+        self._lock = threading.Lock()
+        self._step_done = {}
+        self._steps_left = 0
+
+    def _progress(self, step, count):
+        with self._lock:
+            self._step_done[step] = count
+            self.done = sum(self._step_done.values())
+
+    def _finish_step(self, error=None):
+        with self._lock:
+            if error is not None:
+                self.status = "failed"
+                self.error = error
+            self._steps_left -= 1
+            if self._steps_left == 0 and self.status == "running":
+                self.status = "done"
+
+
+class BulkJobRunner:
+    # 여러 세션이 함께 쓰는 백그라운드 작업기. 작업의 각 단계(쿼리)는 병렬로 실행된다
+    def __init__(self, db, max_workers=4):
+        self._db = db
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-ops")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit_updates(self, label, steps):
+        # steps: [(query, make_update), ...]
+        return self._submit(label, [
+            lambda progress, query=query, make_update=make_update:
+                batched_update(self._db, query.stream(), make_update, progress)
+            for query, make_update in steps
+        ])
+
+    def submit_deletes(self, label, query, on_done=None, before_delete=None):
+        # on_done(삭제한 개수)는 삭제가 끝난 뒤 작업 스레드에서 호출된다 (카운터 보정 등)
+        def task(progress):
+            deleted = bulk_delete(self._db, query, progress, before_delete)
+            if on_done: on_done(deleted)
+        return self._submit(label, [task])
+
+    def submit_task(self, label, fn):
+        # fn(progress)를 백그라운드에서 실행. fn은 progress(n)으로 처리한 개수를 알린다
+        return self._submit(label, [fn])
+
+    def _submit(self, label, tasks):
+        job = BulkJob(label)
+        job._steps_left = len(tasks)
+        with self._lock:
+            self._jobs[job.id] = job
+        if not tasks:
+            job.status = "done"
+        for i, task in enumerate(tasks):
+            self._executor.submit(self._run, job, i, task)
+        return job
+
+    def _run(self, job, step, task):
+        try:
+            task(lambda n: job._progress(step, n))
+        except Exception as e:
+            logging.getLogger(__name__).exception("일괄 작업 실패: %s", job.label)
+            job._finish_step(e)
+        else:
+            job._finish_step()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
@@ -0,0 +1,607 @@
+import abc
+import copy
+import functools
+import logging
+import queue
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+# 앱이 쓰는 컬렉션 이름
+USERS = "users"
+MESSAGES = "global_chat"
+SYSTEM = "system"
+INQUIRIES = "inquiries"
+STATS_HOURLY = "stats_hourly"
+NICKNAMES = "nicknames"
+SCHEDULER_LOCKS = "scheduler_locks"
+ROOMS = "rooms"
+# 기본 방은 방 기능이 생기기 전의 global_chat 컬렉션을 그대로 쓴다
+DEFAULT_ROOM = "global"
+
+DOCUMENT_ID = "__name__"
+
+
+class OpCounter:
+    # 저장소 읽기/쓰기/삭제 횟수 (요금이 매겨지는 단위와 같게 센다)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"reads": 0, "writes": 0, "deletes": 0}
+
+    def add(self, kind, n=1):
+        with self._lock:
+            self._counts[kind] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            for kind in self._counts:
+                self._counts[kind] = 0
+
+
+class DataStore(abc.ABC):
+    # 앱이 쓰는 컬렉션/문서 참조를 한 곳에서 만든다. 백엔드와 상관없이 같은 쿼리 API를 쓴다
+    def __init__(self, db):
+        self.db = db
+        self.users = db.collection(USERS)
+        self.messages = db.collection(MESSAGES)
+        self.system = db.collection(SYSTEM)
+        self.config = self.system.document("config")
+        self.stats = self.system.document("stats")
+        self.inquiries = db.collection(INQUIRIES)
+        self.stats_hourly = db.collection(STATS_HOURLY)
+        self.nicknames = db.collection(NICKNAMES)
+        self.scheduler_locks = db.collection(SCHEDULER_LOCKS)
+        self.rooms = db.collection(ROOMS)
+
+    def room_messages(self, room_id):
+        # 방마다 rooms/{방 ID}/messages 하위 컬렉션
+        if room_id == DEFAULT_ROOM:
+            return self.messages
+        return self.rooms.document(room_id).collection("messages")
+
+    def room_counter(self, room_id):
+        # 방별 메시지 수(message_count)를 두는 문서
+        return self.rooms.document(room_id)
+
+    @abc.abstractmethod
+    def run_transaction(self, fn, *args):
+        # fn(transaction, *args)를 트랜잭션 안에서 실행하고 결과를 돌려준다
+        ...
+
+    def op_counts(self):
+        # 읽기/쓰기 횟수를 셀 수 없는 백엔드는 None
+        return None
+
+
+class FirestoreStore(DataStore):
+    def __init__(self, cred_info):
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(cred_info))
+        super().__init__(firestore.client())
+
+    def run_transaction(self, fn, *args):
+        return firestore.transactional(fn)(self.db.transaction(), *args)
+
+
+class MemoryStore(DataStore):
+    # 한 프로세스 안에서만 유지되는 저장소. 부하 테스트나 Firebase 없이 개발할 때 쓴다
+    def __init__(self):
+        self.counter = OpCounter()
+        super().__init__(MemoryClient(self.counter))
+
+    def run_transaction(self, fn, *args):
+        return self.db.run_transaction(fn, *args)
+
+    def op_counts(self):
+        return self.counter.snapshot()
+
+
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
+
+def open_store(backend, cred_info=None):
+    global _memory_store
+    if backend == "memory":
+        # 메모리 저장소는 프로세스에 하나 (부하 테스트 도구가 같은 저장소의 횟수를 읽을 수 있게)
+        with _memory_store_lock:
+            if _memory_store is None:
+                _memory_store = MemoryStore()
+            return _memory_store
+    if backend == "firestore":
+        return FirestoreStore(cred_info)
+    raise ValueError(f"알 수 없는 저장소 백엔드: {backend}")
+
+
+# --- 메모리 백엔드: 앱이 쓰는 Firestore 클라이언트 API만 흉내 낸다 ---
+
+class NotFound(Exception):
+    pass
+
+
+class AlreadyExists(Exception):
+    pass
+
+
+def _compare(a, b):
+    if isinstance(a, MemoryDocumentReference):
+        a = a.path
+    if isinstance(b, MemoryDocumentReference):
+        b = b.path
+    if a == b:
+        return 0
+    try:
+        return -1 if a < b else 1
+    except TypeError:
+        # 타입이 다른 값은 타입 이름 순으로 (Firestore도 타입별 순서가 정해져 있다)
+        return -1 if type(a).__name__ < type(b).__name__ else 1
+
+
+_OPERATORS = {
+    "==": lambda c: c == 0,
+    "!=": lambda c: c != 0,
+    "<": lambda c: c < 0,
+    "<=": lambda c: c <= 0,
+    ">": lambda c: c > 0,
+    ">=": lambda c: c >= 0,
+}
+
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data, update_time, fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        if data is not None and fields is not None:
+            data = {k: v for k, v in data.items() if k in fields}
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return copy.deepcopy(self._data[field])
+
+    def _value(self, field):
+        if field == DOCUMENT_ID:
+            return self.reference
+        return self._data.get(field, _MISSING)
+
+
+_MISSING = object()
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return MemoryCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._get(self, field_paths)
+
+    def set(self, data, merge=False):
+        self._client._commit([("set", self, data, merge)])
+
+    def create(self, data):
+        self._client._commit([("create", self, data, False)])
+
+    def update(self, data):
+        self._client._commit([("update", self, data, False)])
+
+    def delete(self):
+        self._client._commit([("delete", self, None, False)])
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+
+class MemoryQuery:
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, cursor=None, projection=None):
+        self._client = client
+        self._path = collection_path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      cursor=self._cursor, projection=self._projection)
+        fields.update(changes)
+        return MemoryQuery(self._client, self._path, **fields)
+
+    def where(self, field, op, value):
+        if op not in _OPERATORS and op != "in":
+            raise ValueError(f"지원하지 않는 조건: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction == "DESCENDING"),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, cursor):
+        return self._copy(cursor=cursor)
+
+    def select(self, field_paths):
+        return self._copy(projection=set(field_paths))
+
+    def stream(self, transaction=None):
+        return iter(self.get(transaction))
+
+    def get(self, transaction=None):
+        snaps = self._client._query(self)
+        self._client._counter.add("reads", max(1, len(snaps)))
+        return snaps
+
+    def count(self):
+        return MemoryAggregation(self)
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+    def _effective_orders(self):
+        # 범위 조건 필드가 정렬에 없으면 먼저 그 필드로 정렬하고, 마지막은 항상 문서 ID
+        orders = list(self._orders)
+        ordered = {field for field, _ in orders}
+        for field, op, _ in self._filters:
+            if op not in ("==", "in") and field not in ordered:
+                orders.insert(0, (field, False))
+                ordered.add(field)
+        if DOCUMENT_ID not in ordered:
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else False))
+        return orders
+
+    def _matches(self, snap):
+        for field, op, value in self._filters:
+            actual = snap._value(field)
+            if actual is _MISSING:
+                return False
+            if op == "in":
+                if not any(_compare(actual, v) == 0 for v in value):
+                    return False
+            elif not _OPERATORS[op](_compare(actual, value)):
+                return False
+        for field, _ in self._orders:
+            if snap._value(field) is _MISSING:
+                return False
+        return True
+
+    def _run(self, snaps):
+        orders = self._effective_orders()
+
+        def key_cmp(a, b):
+            for field, descending in orders:
+                c = _compare(a._value(field), b._value(field))
+                if c:
+                    return -c if descending else c
+            return 0
+
+        matched = sorted((s for s in snaps if self._matches(s)), key=functools.cmp_to_key(key_cmp))
+        if self._cursor is not None:
+            matched = [s for s in matched if self._after_cursor(s, orders)]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return matched
+
+    def _after_cursor(self, snap, orders):
+        cursor = self._cursor
+        for field, descending in orders:
+            if isinstance(cursor, MemoryDocumentSnapshot):
+                bound = cursor._value(field)
+            elif field in cursor:
+                bound = cursor[field]
+            else:
+                break
+            c = _compare(snap._value(field), bound)
+            if c:
+                return (-c if descending else c) > 0
+        return False
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return self._client._now(), ref
+
+
+class MemoryAggregation:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self, transaction=None):
+        count = len(self._query._client._query(self._query._copy(projection=set())))
+        # 집계 쿼리는 색인 항목 1000개당 읽기 1회
+        self._query._client._counter.add("reads", max(1, -(-count // 1000)))
+        return [[SimpleNamespace(alias="count", value=count)]]
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(("set", reference, data, merge))
+
+    def create(self, reference, data):
+        self._ops.append(("create", reference, data, False))
+
+    def update(self, reference, data):
+        self._ops.append(("update", reference, data, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        self._client._commit(ops)
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    # 클라이언트 락을 잡은 채로 실행되므로 읽기는 바로, 쓰기는 끝에서 한꺼번에 반영한다
+    pass
+
+
+class MemoryBulkWriter:
+    def __init__(self, client):
+        self._client = client
+        self._callback = None
+
+    def on_write_result(self, callback):
+        self._callback = callback
+
+    def _apply(self, op, reference, data=None, merge=False):
+        self._client._commit([(op, reference, data, merge)])
+        if self._callback:
+            self._callback(reference, SimpleNamespace(update_time=self._client._now()), self)
+
+    def set(self, reference, data, merge=False):
+        self._apply("set", reference, data, merge)
+
+    def create(self, reference, data):
+        self._apply("create", reference, data)
+
+    def update(self, reference, data):
+        self._apply("update", reference, data)
+
+    def delete(self, reference):
+        self._apply("delete", reference)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Watch:
+    def __init__(self, target, callback):
+        self.target = target
+        self.callback = callback
+        self.seen = None  # 문서 ID -> update_time
+        self.active = True
+
+    def unsubscribe(self):
+        self.active = False
+
+
+class MemoryClient:
+    def __init__(self, counter):
+        self._counter = counter
+        self._lock = threading.RLock()
+        self._collections = {}  # 컬렉션 경로 -> {문서 ID: (데이터, update_time)}
+        self._last_time = datetime.min.replace(tzinfo=timezone.utc)
+        self._watches = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+    def collection(self, name):
+        return MemoryCollectionReference(self, name)
+
+    def document(self, path):
+        return MemoryDocumentReference(self, path)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def bulk_writer(self):
+        return MemoryBulkWriter(self)
+
+    def run_transaction(self, fn, *args):
+        with self._lock:
+            transaction = MemoryTransaction(self)
+            result = fn(transaction, *args)
+            transaction.commit()
+            return result
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        snaps = [self._get(ref, field_paths) for ref in references]
+        return iter(snaps)
+
+    def reset(self):
+        with self._lock:
+            self._collections.clear()
+        self._events.put(None)
+
+    def _now(self):
+        # 같은 시각에 여러 번 써도 update_time이 겹치지 않게 한다
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            if now <= self._last_time:
+                now = self._last_time + timedelta(microseconds=1)
+            self._last_time = now
+            return now
+
+    def _split(self, reference):
+        return reference.path.rsplit("/", 1)
+
+    def _get(self, reference, field_paths=None):
+        collection, doc_id = self._split(reference)
+        with self._lock:
+            data, update_time = self._collections.get(collection, {}).get(doc_id, (None, None))
+        self._counter.add("reads")
+        return MemoryDocumentSnapshot(reference, copy.deepcopy(data), update_time,
+                                      set(field_paths) if field_paths is not None else None)
+
+    def _snapshots(self, collection_path, projection=None):
+        with self._lock:
+            docs = list(self._collections.get(collection_path, {}).items())
+        return [
+            MemoryDocumentSnapshot(MemoryDocumentReference(self, f"{collection_path}/{doc_id}"),
+                                   copy.deepcopy(data), update_time, projection)
+            for doc_id, (data, update_time) in docs
+        ]
+
+    def _query(self, query):
+        # 조건/정렬 판단은 전체 필드로 하고, 돌려줄 때만 select 필드로 줄인다
+        matched = query._run(self._snapshots(query._path))
+        if query._projection is None:
+            return matched
+        return [MemoryDocumentSnapshot(s.reference, s._data, s.update_time, query._projection) for s in matched]
+
+    def _resolve(self, current, data, merge):
+        result = dict(current) if (merge and current is not None) else {}
+        for key, value in data.items():
+            if value is firestore.DELETE_FIELD:
+                result.pop(key, None)
+            elif value is firestore.SERVER_TIMESTAMP:
+                result[key] = self._now()
+            elif isinstance(value, firestore.Increment):
+                base = result.get(key) if merge else None
+                result[key] = (base if isinstance(base, (int, float)) else 0) + value.value
+            else:
+                result[key] = copy.deepcopy(value)
+        return result
+
+    def _commit(self, ops):
+        # 배치 안의 쓰기는 모두 반영되거나 하나도 반영되지 않는다
+        with self._lock:
+            staged = {}
+            for op, reference, data, merge in ops:
+                collection, doc_id = self._split(reference)
+                key = (collection, doc_id)
+                current = staged[key] if key in staged else self._collections.get(collection, {}).get(doc_id, (None, None))[0]
+                if op == "delete":
+                    staged[key] = None
+                elif op == "create":
+                    if current is not None:
+                        raise AlreadyExists(reference.path)
+                    staged[key] = self._resolve(None, data, False)
+                elif op == "update":
+                    if current is None:
+                        raise NotFound(reference.path)
+                    staged[key] = self._resolve(current, data, True)
+                else:
+                    staged[key] = self._resolve(current, data, merge)
+            update_time = self._now()
+            for (collection, doc_id), data in staged.items():
+                docs = self._collections.setdefault(collection, {})
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = (data, update_time)
+            for op, _, _, _ in ops:
+                self._counter.add("deletes" if op == "delete" else "writes")
+        if ops and self._watches:
+            self._events.put(None)
+
+    # --- 실시간 리스너: 쓰기가 있을 때마다 별도 스레드에서 결과를 다시 계산해 바뀐 문서만 알린다 ---
+    def _watch(self, target, callback):
+        watch = _Watch(target, callback)
+        with self._lock:
+            self._watches.append(watch)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="memory-store-watch", daemon=True)
+                self._dispatcher.start()
+        self._events.put(None)
+        return watch
+
+    def _dispatch_loop(self):
+        while True:
+            self._events.get()
+            # 밀린 이벤트는 한 번에 처리
+            while not self._events.empty():
+                self._events.get_nowait()
+            with self._lock:
+                self._watches = [w for w in self._watches if w.active]
+                watches = list(self._watches)
+            for watch in watches:
+                self._notify(watch)
+
+    def _notify(self, watch):
+        if isinstance(watch.target, MemoryDocumentReference):
+            collection, doc_id = self._split(watch.target)
+            with self._lock:
+                data, update_time = self._collections.get(collection, {}).get(doc_id, (None, None))
+            docs = [MemoryDocumentSnapshot(watch.target, copy.deepcopy(data), update_time)]
+            current = {doc_id: update_time} if data is not None else {}
+        else:
+            docs = self._query(watch.target)
+            current = {snap.id: snap.update_time for snap in docs}
+
+        previous = watch.seen
+        changes = []
+        by_id = {snap.id: (i, snap) for i, snap in enumerate(docs)}
+        for doc_id, update_time in current.items():
+            index, snap = by_id[doc_id]
+            if previous is None or doc_id not in previous:
+                changes.append(_change("ADDED", snap, -1, index))
+            elif previous[doc_id] != update_time:
+                changes.append(_change("MODIFIED", snap, index, index))
+        for doc_id in (previous or {}):
+            if doc_id not in current:
+                ref = MemoryDocumentReference(self, f"{self._split_path(watch.target)}/{doc_id}")
+                changes.append(_change("REMOVED", MemoryDocumentSnapshot(ref, None, None), -1, -1))
+        if previous is not None and not changes:
+            return
+        watch.seen = current
+        self._counter.add("reads", max(1, len(changes)))
+        try:
+            watch.callback(docs, changes, self._now())
+        except Exception:
+            # 실제 리스너처럼 콜백 오류가 다른 리스너를 멈추게 하지 않는다
+            logging.getLogger(__name__).exception("리스너 콜백 실패")
+
+    def _split_path(self, target):
+        if isinstance(target, MemoryDocumentReference):
+            return self._split(target)[0]
+        return target._path
+
+
+def _change(kind, document, old_index, new_index):
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=document,
+                           old_index=old_index, new_index=new_index)
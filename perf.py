@@ -0,0 +1,318 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# 집계에 쓰는 최근 구간(초)과 항목별 보관 샘플 수
+WINDOW_SECONDS = 600
+MAX_SAMPLES = 5000
+MAX_RERUNS = 500
+# CHAT_PERF_LOG=1이면 실행(rerun)마다 JSON 한 줄을 "perf" 로거로 남긴다
+LOG_RERUNS = os.environ.get("CHAT_PERF_LOG") == "1"
+
+# 저장소 쪽 메서드 분류
+READ_OPS = {"get", "stream", "get_all"}
+WRITE_OPS = {"set", "update", "delete", "add", "create"}
+FLUSH_OPS = {"commit", "close", "flush"}
+CHAIN_OPS = {
+    "collection", "document", "where", "order_by", "limit", "limit_to_last", "offset",
+    "start_at", "start_after", "end_at", "end_before", "select", "count", "batch", "bulk_writer",
+}
+
+_local = threading.local()
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class PerfRegistry:
+    # 모든 세션이 함께 쓰는 최근 WINDOW_SECONDS 동안의 측정값
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._reruns = deque(maxlen=MAX_RERUNS)
+
+    def record(self, name, ms, reads=0, writes=0):
+        now = time.time()
+        with self._lock:
+            samples = self._metrics.get(name)
+            if samples is None:
+                samples = self._metrics[name] = deque(maxlen=MAX_SAMPLES)
+            samples.append((now, ms, reads, writes))
+
+    def record_rerun(self, summary):
+        with self._lock:
+            self._reruns.append(summary)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+            self._reruns.clear()
+
+    def _recent(self, samples, cutoff):
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return list(samples)
+
+    def metric_summary(self):
+        cutoff = time.time() - self.window
+        rows = []
+        with self._lock:
+            items = [(name, self._recent(samples, cutoff)) for name, samples in self._metrics.items()]
+        for name, samples in sorted(items):
+            if not samples:
+                continue
+            durations = sorted(s[1] for s in samples)
+            rows.append({
+                "항목": name,
+                "호출": len(samples),
+                "분당 호출": round(len(samples) * 60 / self.window, 1),
+                "평균 ms": round(sum(durations) / len(durations), 1),
+                "p50 ms": round(_percentile(durations, 0.50), 1),
+                "p95 ms": round(_percentile(durations, 0.95), 1),
+                "최대 ms": round(durations[-1], 1),
+                "읽기": sum(s[2] for s in samples),
+                "쓰기": sum(s[3] for s in samples),
+            })
+        return rows
+
+    def rerun_summary(self):
+        cutoff = time.time() - self.window
+        with self._lock:
+            reruns = [r for r in self._reruns if r["at"] >= cutoff]
+        by_label = {}
+        for r in reruns:
+            by_label.setdefault(r["label"], []).append(r)
+        rows = []
+        for label, items in sorted(by_label.items()):
+            durations = sorted(r["ms"] for r in items)
+            rows.append({
+                "화면": label,
+                "실행 수": len(items),
+                "평균 ms": round(sum(durations) / len(durations), 1),
+                "p95 ms": round(_percentile(durations, 0.95), 1),
+                "평균 호출": round(sum(r["ops"] for r in items) / len(items), 1),
+                "평균 읽기": round(sum(r["reads"] for r in items) / len(items), 1),
+                "평균 쓰기": round(sum(r["writes"] for r in items) / len(items), 1),
+                "최대 읽기": max(r["reads"] for r in items),
+            })
+        return rows
+
+    def heaviest_reruns(self, count=10):
+        cutoff = time.time() - self.window
+        with self._lock:
+            reruns = [r for r in self._reruns if r["at"] >= cutoff]
+        return sorted(reruns, key=lambda r: (r["reads"] + r["writes"], r["ms"]), reverse=True)[:count]
+
+
+registry = PerfRegistry()
+
+
+class RerunTrace:
+    # 한 번의 스크립트 실행(또는 조각 실행) 동안의 저장소 호출과 구간별 시간
+    def __init__(self, label):
+        self.label = label
+        self.thread = threading.get_ident()
+        self.started = time.perf_counter()
+        self.last_activity = self.started
+        self.finished = False
+        self.ops = 0
+        self.reads = 0
+        self.writes = 0
+        self.op_ms = 0.0
+        self.sections = {}
+
+    def add_op(self, ms, reads, writes):
+        self.ops += 1
+        self.reads += reads
+        self.writes += writes
+        self.op_ms += ms
+        self.last_activity = time.perf_counter()
+
+    def add_section(self, name, ms):
+        self.sections[name] = self.sections.get(name, 0.0) + ms
+        self.last_activity = time.perf_counter()
+
+    def finish(self, end=None):
+        if self.finished:
+            return
+        self.finished = True
+        ms = ((end or time.perf_counter()) - self.started) * 1000
+        summary = {
+            "at": time.time(),
+            "label": self.label,
+            "ms": round(ms, 1),
+            "ops": self.ops,
+            "reads": self.reads,
+            "writes": self.writes,
+            "op_ms": round(self.op_ms, 1),
+            "sections": {name: round(v, 1) for name, v in self.sections.items()},
+        }
+        registry.record_rerun(summary)
+        if LOG_RERUNS:
+            logging.getLogger("perf").info(json.dumps(summary, ensure_ascii=False))
+
+
+def current_trace():
+    trace = getattr(_local, "trace", None)
+    if trace is None or trace.finished or trace.thread != threading.get_ident():
+        return None
+    return trace
+
+
+def begin_rerun(state, label):
+    # st.rerun()/st.stop()으로 끝나서 마무리되지 못한 이전 실행은 마지막 활동 시각 기준으로 기록
+    previous = state.get("_perf_trace")
+    if previous is not None and not previous.finished:
+        previous.finish(previous.last_activity)
+    trace = RerunTrace(label)
+    state["_perf_trace"] = trace
+    _local.trace = trace
+    return trace
+
+
+def end_rerun():
+    trace = current_trace()
+    if trace is not None:
+        trace.finish()
+
+
+def set_label(label):
+    trace = current_trace()
+    if trace is not None:
+        trace.label = label
+
+
+def record_op(name, ms, reads=0, writes=0):
+    trace = current_trace()
+    if trace is None:
+        # 리스너/스케줄러/일괄 작업 스레드에서 나온 호출
+        name += " (백그라운드)"
+    else:
+        trace.add_op(ms, reads, writes)
+    registry.record(name, ms, reads, writes)
+
+
+class section:
+    # with perf.section("kick_check"): ... 처럼 화면 구간의 시간을 잰다
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self._start) * 1000
+        trace = current_trace()
+        if trace is not None:
+            trace.add_section(self.name, ms)
+        registry.record(f"section.{self.name}", ms)
+        return False
+
+
+def timed(name, standalone=False):
+    # 함수 단위 구간 측정. standalone이면 진행 중인 실행이 없을 때(조각 단독 실행) 그 자체를 하나의 실행으로 기록한다
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not standalone or current_trace() is not None:
+                with section(name):
+                    return fn(*args, **kwargs)
+            trace = RerunTrace(f"fragment.{name}")
+            previous = getattr(_local, "trace", None)
+            _local.trace = trace
+            try:
+                with section(name):
+                    return fn(*args, **kwargs)
+            finally:
+                trace.finish()
+                _local.trace = previous
+        return wrapper
+    return decorator
+
+
+# --- 저장소 호출 측정: 컬렉션/문서/쿼리/배치 객체를 감싸서 끝단 호출(get, stream, set ...)의 시간과 횟수를 잰다 ---
+
+def _unwrap(value):
+    if isinstance(value, Traced):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(v) for v in value)
+    return value
+
+
+def _read_count(result):
+    if isinstance(result, list):
+        return max(1, len(result))
+    return 1
+
+
+class Traced:
+    __slots__ = ("_target", "_buffered")
+
+    def __init__(self, target, buffered=False):
+        # buffered: 배치/트랜잭션/BulkWriter처럼 쓰기를 모았다가 commit/close 때 보내는 객체
+        self._target = target
+        self._buffered = buffered
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        if name in CHAIN_OPS:
+            buffered = name in ("batch", "bulk_writer")
+            return lambda *args, **kwargs: Traced(attr(*_unwrap(args), **{k: _unwrap(v) for k, v in kwargs.items()}), buffered)
+        if name in READ_OPS or name in WRITE_OPS or name in FLUSH_OPS:
+            return functools.partial(self._call, name, attr)
+        return attr
+
+    def _call(self, name, attr, *args, **kwargs):
+        args = _unwrap(args)
+        kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+        if self._buffered and name in WRITE_OPS:
+            # 모으기만 하는 호출은 시간 없이 쓰기 수만 센다 (실제 전송은 commit/close)
+            result = attr(*args, **kwargs)
+            record_op("firestore.batch_" + name, 0.0, writes=1)
+            return result
+        start = time.perf_counter()
+        result = attr(*args, **kwargs)
+        ms = (time.perf_counter() - start) * 1000
+        if name in ("stream", "get_all"):
+            return self._traced_iter(name, result, ms)
+        if name in READ_OPS:
+            record_op("firestore." + name, ms, reads=_read_count(result))
+        elif name in WRITE_OPS:
+            record_op("firestore." + name, ms, writes=1)
+        else:
+            record_op("firestore." + name, ms)
+        return result
+
+    def _traced_iter(self, name, iterator, ms):
+        # 문서를 받는 동안(next 호출)만 시간에 넣는다
+        count = 0
+        iterator = iter(iterator)
+        try:
+            while True:
+                step = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    ms += (time.perf_counter() - step) * 1000
+                    return
+                ms += (time.perf_counter() - step) * 1000
+                count += 1
+                yield item
+        finally:
+            record_op("firestore." + name, ms, reads=max(1, count))
+
+
+def traced(target, buffered=False):
+    return Traced(target, buffered)
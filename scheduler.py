@@ -0,0 +1,95 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+def _acquire_lease(transaction, lock_ref, owner, ttl_seconds):
+    # 다른 서버가 아직 유효한 임대를 가지고 있으면 실패
+    snap = lock_ref.get(transaction=transaction)
+    now = datetime.now(timezone.utc)
+    data = snap.to_dict() if snap.exists else {}
+    holder = data.get("owner")
+    expires_at = data.get("expires_at")
+    if holder and holder != owner and expires_at and expires_at > now:
+        return False
+    transaction.set(lock_ref, {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)})
+    return True
+
+
+class PeriodicTask:
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = time.monotonic()
+        self.last_run = None
+        self.last_result = None
+        # 같은 서버 안에서 주기 실행과 즉시 실행(run_now)이 겹치지 않게 한다 (임대는 서버 단위라 막지 못함)
+        self.running = threading.Lock()
+
+
+class PeriodicScheduler:
+    # 서버 프로세스 안에서 주기 작업을 돌리는 스케줄러.
+    # 작업마다 Firestore 임대(lock) 문서를 잡아서 여러 서버가 같은 작업을 중복 실행하지 않게 한다
+    # run_transaction(fn, *args)는 fn(transaction, *args)를 트랜잭션으로 실행해 주는 함수 (DataStore.run_transaction)
+    def __init__(self, run_transaction, lock_collection, tick=1.0):
+        self._run_transaction = run_transaction
+        self._lock_collection = lock_collection
+        self._tick = tick
+        self._tasks = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def add_task(self, name, interval, fn):
+        self._tasks.append(PeriodicTask(name, interval, fn))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="maintenance-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_now(self, name, **kwargs):
+        # 주기를 기다리지 않고 작업을 바로 실행 (관리자 버튼 등). 주기 실행과 같은 임대를 잡고, 실행하지 못했으면 예외
+        task = next(task for task in self._tasks if task.name == name)
+        if not self._run(task, **kwargs):
+            raise RuntimeError(task.last_result)
+        return task.last_result
+
+    def status(self):
+        return [(task.name, task.interval, task.last_run, task.last_result) for task in self._tasks]
+
+    def _loop(self):
+        while not self._stop.wait(self._tick):
+            now = time.monotonic()
+            for task in self._tasks:
+                if now >= task.next_run:
+                    task.next_run = now + task.interval
+                    self._run(task)
+
+    def _run(self, task, **kwargs):
+        # 작업을 끝까지 실행했으면 True
+        if not task.running.acquire(blocking=False):
+            task.last_result = "이미 실행 중"
+            return False
+        try:
+            lock_ref = self._lock_collection.document(task.name)
+            if not self._run_transaction(_acquire_lease, lock_ref, self.owner, task.interval):
+                task.last_result = "다른 서버에서 실행 중"
+                return False
+            task.last_result = task.fn(**kwargs)
+            return True
+        except Exception as e:
+            logging.getLogger(__name__).exception("주기 작업 실패: %s", task.name)
+            task.last_result = f"실패: {e}"
+            return False
+        finally:
+            task.last_run = datetime.now(timezone.utc)
+            task.running.release()
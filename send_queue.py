@@ -0,0 +1,111 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from google.api_core import exceptions as api_exceptions
+
+# 잠깐 기다렸다 다시 보내면 성공할 수 있는 오류
+TRANSIENT_ERRORS = (
+    api_exceptions.Aborted,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+)
+
+
+class PendingSend:
+    # 세션이 화면에 먼저 보여 주는(낙관적 표시) 전송 대기 메시지
+    def __init__(self, room_id, data, doc_id=None):
+        self.room_id = room_id
+        self.doc_id = doc_id or uuid.uuid4().hex[:20]
+        self.data = data
+        self.created = time.time()
+        self.status = "pending"  # pending → sent / failed
+        self.error = None
+
+
+class SendQueue:
+    # 여러 세션의 메시지를 쓰기 스레드 하나가 모아서, window초 안에 들어온 것을 WriteBatch 하나로 커밋한다.
+    # write(batch, items)가 배치에 쓰기를 담고, was_committed(item)은 응답이 끊긴 커밋이 실제로 반영됐는지 확인한다
+    def __init__(self, db, write, window=0.05, max_batch=200, retries=3, backoff=0.2,
+                 was_committed=None, on_commit=None):
+        self._db = db
+        self._write = write
+        self.window = window
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self._was_committed = was_committed
+        self._on_commit = on_commit
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="chat-send-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, room_id, data, doc_id=None):
+        item = PendingSend(room_id, data, doc_id)
+        self._queue.put(item)
+        return item
+
+    def retry(self, item):
+        # 실패한 메시지를 같은 문서 ID로 다시 보낸다 (이미 반영됐다면 덮어쓸 뿐 중복되지 않는다)
+        item.status = "pending"
+        item.error = None
+        self._queue.put(item)
+
+    def _loop(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(items)
+
+    def _commit(self, items):
+        for attempt in range(self.retries + 1):
+            try:
+                batch = self._db.batch()
+                self._write(batch, items)
+                batch.commit()
+                break
+            except TRANSIENT_ERRORS as e:
+                if self._committed_anyway(items[0]):
+                    break
+                if attempt == self.retries:
+                    self._fail(items, e)
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+            except Exception as e:
+                self._fail(items, e)
+                return
+
+        for item in items:
+            item.status = "sent"
+        if self._on_commit:
+            try:
+                self._on_commit(items)
+            except Exception:
+                logging.getLogger(__name__).exception("전송 후 처리 실패")
+
+    def _committed_anyway(self, item):
+        # 배치는 전부 반영되거나 전혀 반영되지 않으므로 첫 메시지만 확인하면 된다
+        if not self._was_committed:
+            return False
+        try:
+            return self._was_committed(item)
+        except Exception:
+            return False
+
+    def _fail(self, items, error):
+        logging.getLogger(__name__).warning("메시지 %d개 전송 실패: %s", len(items), error)
+        for item in items:
+            item.error = str(error)
+            item.status = "failed"
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # 여러 세션(스레드)이 함께 쓰는 TTL + LRU 캐시
+    def __init__(self, ttl, max_size=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, max_age=None):
+        # max_age를 주면 ttl보다 짧은 기준으로 신선도를 판단한다
+        limit = self.ttl if max_age is None else min(self.ttl, max_age)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= limit:
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, max_age=None):
+        value = self.get(key, _MISSING, max_age)
+        if value is _MISSING:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,81 @@
+from collections import deque
+from functools import lru_cache
+
+
+def split_banned_words(banned_words_str):
+    return [w.strip() for w in banned_words_str.split(",") if w.strip()]
+
+
+class BannedWordMatcher:
+    # 금칙어 목록을 Aho-Corasick 오토마타로 한 번만 컴파일해 두고 메시지마다 재사용
+    def __init__(self, banned_words_str):
+        self.words = split_banned_words(banned_words_str or "")
+        # '*'가 들어간 금칙어는 앞선 치환 결과로 새로 생길 수 있어서 항상 검사 대상에 넣는다
+        self._star_words = {w for w in self.words if "*" in w}
+        self._positions = {}
+        for i, word in enumerate(self.words):
+            self._positions.setdefault(word, []).append(i)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for word in set(self.words):
+            self._add(word)
+        self._build()
+
+    def _add(self, word):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            state = nxt
+        self._out[state].add(word)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def find(self, text):
+        # text에 들어 있는 금칙어 집합 (겹치는 것도 모두 포함)
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+    def filter(self, text):
+        # 기존 filter_message와 같은 결과: 목록 순서대로 치환하되, 실제로 들어 있는 단어만 처리
+        if not self.words:
+            return text
+        candidates = self.find(text) | self._star_words
+        if not candidates:
+            return text
+        order = sorted(i for word in candidates for i in self._positions[word])
+        for i in order:
+            word = self.words[i]
+            if word in text:
+                text = text.replace(word, "*" * len(word))
+        return text
+
+
+@lru_cache(maxsize=8)
+def compile_banned_words(banned_words_str):
+    # system/config의 금칙어 문자열 내용이 같으면 같은 매처를 돌려준다
+    return BannedWordMatcher(banned_words_str)